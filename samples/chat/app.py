@@ -1,62 +1,67 @@
-from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
 from autogen_agentchat.agents import AssistantAgent, UserProxyAgent
 from autogen_agentchat.teams import RoundRobinGroupChat, SelectorGroupChat, Swarm
 from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination
 from autogen_agentchat.ui import Console
-from azure.ai.projects import AIProjectClient
+import functools
 import os
 import asyncio
 import dotenv
-from langchain_community.vectorstores.azuresearch import AzureSearch
-import json
 from samples.chat.model import Document, User
-from samples.chat.search_index import index_documents, search_index
-from samples.chat.common import get_default_token_provider
-from azure.identity import DefaultAzureCredential
+from samples.chat.search_index import SEARCH_BACKEND, aindex_documents, asearch_index, close_search_indexes, get_query_embeddings, search_cache_stats
+from samples.chat.bulk_index import iter_templates
+from samples.chat.selector import FlowSelector
+from samples.chat.model_pool import get_model_pool, model_lane
+from samples.chat.response_cache import CachedChatCompletionClient, ResponseStore
 
 dotenv.load_dotenv()
 
 DOCUMENT_INDEX_NAME = "document-index"
 api_key = os.getenv("AZURE_SEARCH_API_KEY")
 
-completion_model_client = AzureOpenAIChatCompletionClient(
-    azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
-    model=os.getenv("AZURE_OPENAI_COMPLETION_MODEL"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=api_key if api_key else None,
-    azure_ad_token_provider=get_default_token_provider() if not api_key else None,
-    model_info={
-        "json_output": False,
-        "function_calling": True,
-        "vision": False,
-        "family": "unknown",
-    },
-)
+# Clients are created on first use, importing the app for tests or tooling does not need credentials or a network
+@functools.cache
+def get_completion_model_client():
+    # Every agent shares the pooled client, its connections, credential and rate limits
+    return get_model_pool().chat_client(
+        azure_deployment=os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"),
+        model=os.getenv("AZURE_OPENAI_COMPLETION_MODEL"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=api_key if api_key else None,
+        model_info={
+            "json_output": False,
+            "function_calling": True,
+            "vision": False,
+            "family": "unknown",
+        },
+    )
+
+@functools.cache
+def get_response_store() -> ResponseStore | None:
+    response_cache_path = os.getenv("MODEL_RESPONSE_CACHE")
+    if not response_cache_path:
+        return None
+    return ResponseStore(response_cache_path, ttl=float(os.getenv("MODEL_RESPONSE_CACHE_TTL_SECONDS", 24 * 3600)))
+
+@functools.cache
+def get_cached_model_client():
+    # Opt-in cache for the turns that are deterministic given their messages: template search summaries and speaker selection
+    if get_response_store() is None:
+        return get_completion_model_client()
+    response_similarity = os.getenv("MODEL_RESPONSE_CACHE_SIMILARITY")
+    return CachedChatCompletionClient(
+        get_completion_model_client(),
+        get_response_store(),
+        embeddings=get_query_embeddings() if response_similarity else None,
+        similarity_threshold=float(response_similarity or 0.95),
+    )
 
 def parse_templates(json_file_path: str) -> list[Document]:
-    with open(json_file_path, "r", encoding="utf-8") as f:
-        templates = json.load(f)
-
-    docs = []
-    for t in templates:
-        docs.append(
-            Document(
-                id=str(t.get("id", "")),
-                page_content=t.get("body", ""),
-                metadata={
-                    "topic": t.get("topic", ""),
-                    "subject": t.get("subject", "")
-                },
-            )
-        )
-    return docs
-
-#project_client = AIProjectClient.from_connection_string("#####", DefaultAzureCredential())
-
-def search_tool(query: str) -> list[Document]:
+    return list(iter_templates(json_file_path))
+
+async def search_tool(query: str) -> list[Document]:
     """Tool that searches database for fitting email templates that are relevant to the query."""
-    search = search_index(DOCUMENT_INDEX_NAME, query)
+    search = await asearch_index(DOCUMENT_INDEX_NAME, query)
     return search
 
 def find_relevant_user_tool(query: str) -> list[User]:
@@ -69,15 +74,18 @@ def send_email_tool(email: str, subject: str, body: str) -> str:
 
 async def main():
 
-    #docs = parse_templates("samples/chat/assets/templates.json")
-    #index_documents(DOCUMENT_INDEX_NAME, docs)
+    #await aindex_documents(DOCUMENT_INDEX_NAME, iter_templates("samples/chat/assets/templates.json"), manifest_path="samples/chat/assets/templates.manifest.json")
+    if SEARCH_BACKEND == "local":
+        # The local index is small and persisted, upserting keeps it in sync with the template file
+        with model_lane("background"):
+            await aindex_documents(DOCUMENT_INDEX_NAME, iter_templates("samples/chat/assets/templates.json"))
 
     search_agent_prompt = """I am an agent that searches for email templates, based on an input query. 
         I handover to the user_proxy agent to ask for a template selection."""
     search_agent = AssistantAgent(
         description=search_agent_prompt,
         name = "search_agent",
-        model_client = completion_model_client,
+        model_client = get_cached_model_client(),
         tools = [search_tool],
         system_message = search_agent_prompt,
         reflect_on_tool_use = True
@@ -87,7 +95,7 @@ async def main():
     compose_agent = AssistantAgent(
         description="Customizes the selected email template by user input.",
         name = "compose_agent",
-        model_client = completion_model_client,
+        model_client = get_completion_model_client(),
         system_message = compose_agent_prompt,
         reflect_on_tool_use = True
     )
@@ -96,7 +104,7 @@ async def main():
     send_email_agent = AssistantAgent(
         description="Define mail recipients and send emails",
         name = "send_email_agent",
-        model_client = completion_model_client,
+        model_client = get_completion_model_client(),
         tools=[send_email_tool, find_relevant_user_tool],
         system_message = send_email_agent_prompt,
         reflect_on_tool_use = True
@@ -107,6 +115,8 @@ async def main():
 
     #team = RoundRobinGroupChat([search_agent, compose_agent, user_proxy], termination_condition=termination_condition)
 
+    # Fixed instructions and roles first, then the growing history, then the participants, which change with the
+    # previous speaker. Consecutive selections share the leading part of the prompt, which the service can cache
     selector_prompt = """Your job is to orchestrate the agents to find an email template for an input query.
 
     You select the agents based on the following flow:
@@ -114,24 +124,39 @@ async def main():
 
     {roles}
 
+    Make sure the user_proxy is involved whenever input is required.
+    Only select one agent.
+
     Current conversation context:
     {history}
 
     Read the above conversation, then select an agent from {participants} to perform the next task.
-    Make sure the user_proxy is involved whenever input is required.
-    Only select one agent.
     """
 
     participants = [search_agent, compose_agent, send_email_agent, user_proxy]
 
+    # Follows the flow above without a model call, ambiguous user replies are left to the selector prompt
+    flow_selector = FlowSelector(stages=["search_agent", "compose_agent", "send_email_agent"], user="user_proxy")
+
     team = SelectorGroupChat(
         participants=participants, 
         termination_condition=termination_condition,
-        model_client=completion_model_client,
+        model_client=get_cached_model_client(),
         selector_prompt=selector_prompt,
+        selector_func=flow_selector,
         allow_repeated_speaker=False
     )
 
-    await Console(team.run_stream(task="Find an email template for a product recall."), output_stats=True)
-
-asyncio.run(main())
\ No newline at end of file
+    try:
+        await Console(team.run_stream(task="Find an email template for a product recall."), output_stats=True)
+    finally:
+        print(f"Search cache: {search_cache_stats()}")
+        print(f"Speaker selection: {flow_selector.stats()}")
+        print(f"Model pool: {get_model_pool().stats()}")
+        if get_response_store() is not None:
+            print(f"Response cache: {get_response_store().stats()}")
+        await close_search_indexes()
+        await get_model_pool().close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
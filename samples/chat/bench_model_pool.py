@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import time
+from aiohttp import web
+from autogen_core.models import UserMessage
+from samples.chat.fake_openai import FakeOpenAIServer
+from samples.chat.model_pool import ModelClientPool, model_lane
+
+MODEL_INFO = {"json_output": False, "function_calling": True, "vision": False, "family": "unknown"}
+
+def percentile(values: list[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+async def timed_request(client, lane: str, latencies: dict[str, list[float]]):
+    start = time.perf_counter()
+    with model_lane(lane):
+        await client.create([UserMessage(content="Find an email template for a product recall.", source="user")])
+    latencies[lane].append(time.perf_counter() - start)
+
+async def run(args):
+    server = FakeOpenAIServer(requests_per_minute=args.server_rpm, latency=args.latency)
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    pool = ModelClientPool(requests_per_minute=args.pool_rpm, tokens_per_minute=args.pool_tpm)
+    client = pool.chat_client(
+        azure_deployment="fake", model="gpt-4o-2024-08-06", api_version="2024-10-21", azure_endpoint=f"http://127.0.0.1:{args.port}",
+        api_key="fake", model_info=MODEL_INFO,
+    )
+    latencies: dict[str, list[float]] = {"interactive": [], "background": []}
+    start = time.perf_counter()
+    # Background work is queued first, interactive turns still get the capacity as soon as they arrive
+    background = [asyncio.create_task(timed_request(client, "background", latencies)) for _ in range(args.background)]
+    await asyncio.sleep(0.1)
+    interactive = [asyncio.create_task(timed_request(client, "interactive", latencies)) for _ in range(args.interactive)]
+    await asyncio.gather(*background, *interactive)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.interactive + args.background} requests in {elapsed:.2f}s, server served {server.served}, answered 429 {server.throttled} times")
+    for lane, values in latencies.items():
+        print(f"{lane:<12} p50 {percentile(values, 50):6.2f}s p95 {percentile(values, 95):6.2f}s max {max(values, default=0):6.2f}s")
+    print(f"pool: {pool.stats()}")
+    await pool.close()
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs interactive and background requests through the model client pool against a fake server.")
+    parser.add_argument("--interactive", type=int, default=10)
+    parser.add_argument("--background", type=int, default=40)
+    parser.add_argument("--pool-rpm", type=float, default=300)
+    parser.add_argument("--pool-tpm", type=float, default=100_000)
+    parser.add_argument("--server-rpm", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=8780)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Module names are imported, file paths are loaded as a module of their sample like "python -m" would
+ENTRY_POINTS = [
+    "samples.chat.app",
+    "samples.chat.search_index",
+    "samples.chat.model_pool",
+    "samples/ingestion-pipeline/app.py",
+]
+
+# Runs in a fresh interpreter per entry point, so every measurement starts with empty module and client caches
+_PROBE = """
+import importlib, importlib.util, json, os, resource, sys, time, types
+target = sys.argv[1]
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+error = None
+try:
+    if target.endswith(".py"):
+        directory = os.path.dirname(os.path.abspath(target))
+        package = "samples." + os.path.basename(directory).replace("-", "_")
+        module = types.ModuleType(package)
+        module.__path__ = [directory]
+        sys.modules[package] = module
+        importlib.import_module(f"{package}.{os.path.basename(target)[:-3]}")
+    else:
+        importlib.import_module(target)
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+seconds = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": seconds, "rss_mb": rss / 1024, "import_rss_mb": (rss - before) / 1024, "modules": len(sys.modules), "error": error}))
+"""
+
+def measure(target: str, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", _PROBE, target], capture_output=True, text=True, cwd=os.getcwd())
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit code {completed.returncode}"}
+        run = json.loads(lines[-1])
+        if run["error"]:
+            # The timing of an import that raised says nothing about the entry point's startup
+            return {"error": run["error"]}
+        runs.append(run)
+    best = min(runs, key=lambda run: run["seconds"])
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures import time and resident memory per entry point, run from the repository root.")
+    parser.add_argument("targets", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per entry point, the fastest is reported")
+    args = parser.parse_args()
+
+    print(f"{'entry point':<40} {'import':>9} {'rss':>9} {'+rss':>9} {'modules':>8}")
+    for target in args.targets:
+        result = measure(target, args.repeat)
+        if result.get("error"):
+            print(f"{target:<40} failed: {result['error']}")
+            continue
+        print(f"{target:<40} {result['seconds'] * 1000:7.0f}ms {result['rss_mb']:7.1f}MB {result['import_rss_mb']:7.1f}MB {result['modules']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import IO, TYPE_CHECKING, Any, Iterable, Iterator, Literal, Optional
+from langchain_core.embeddings import Embeddings
+from samples.chat.local_index import LocalSearchIndex
+from samples.chat.model import Document
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores.azuresearch import AzureSearch
+
+logger = logging.getLogger(__name__)
+
+# "upsert" replaces documents with the same id, "merge" only updates the given fields of existing documents
+WriteMode = Literal["upsert", "merge"]
+
+# Fields of a document that are hashed in the manifest, a changed content also changes its vector
+_FIELDS = ("content", "metadata")
+
+def template_to_document(template: dict) -> Document:
+    return Document(
+        id=str(template.get("id", "")),
+        page_content=template.get("body", ""),
+        metadata={
+            "topic": template.get("topic", ""),
+            "subject": template.get("subject", "")
+        },
+    )
+
+def iter_json_array(f: IO[str], chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Decodes the items of a JSON array one at a time, only the current item and one chunk are held in memory."""
+    decoder = json.JSONDecoder()
+    buffer, eof = "", False
+    # "open" expects the "[", "value" an item or the "]" of an empty array, "separator" a "," or the "]"
+    state, empty = "open", True
+    while True:
+        buffer = buffer.lstrip()
+        if not buffer and not eof:
+            chunk = f.read(chunk_size)
+            buffer, eof = buffer + chunk, not chunk
+            continue
+        if not buffer:
+            raise ValueError("The JSON array is incomplete.")
+        if state == "open":
+            if buffer[0] != "[":
+                raise ValueError("Expected a JSON array.")
+            buffer, state = buffer[1:], "value"
+        elif state == "separator":
+            if buffer[0] == "]":
+                return
+            if buffer[0] != ",":
+                raise ValueError(f"Expected , or ] after an item of the JSON array, got {buffer[:20]!r}.")
+            buffer, state = buffer[1:], "value"
+        elif empty and buffer[0] == "]":
+            return
+        else:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise ValueError(f"Invalid item in the JSON array: {e}") from e
+                decoded = False
+            else:
+                # Only complete once the separator follows, a number could continue in the next chunk
+                decoded = eof or buffer[end:].lstrip()[:1] in (",", "]")
+            if not decoded:
+                chunk = f.read(chunk_size)
+                buffer, eof = buffer + chunk, not chunk
+                continue
+            yield item
+            buffer, state, empty = buffer[end:], "separator", False
+
+def iter_templates(path: str) -> Iterator[Document]:
+    """Reads templates one at a time from a JSON Lines file or a JSON array."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield template_to_document(json.loads(line))
+        else:
+            for template in iter_json_array(f):
+                yield template_to_document(template)
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+def _hash(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _fingerprint(doc: Document) -> dict[str, str]:
+    return {"content": _hash(doc.page_content), "metadata": _hash(doc.metadata)}
+
+@dataclass
+class BulkIndexResult:
+    indexed: int = 0
+    # Unchanged since the last run according to the manifest
+    skipped: int = 0
+    failed: list[str] = field(default_factory=list)
+
+class BulkIndexer:
+    """Streams documents into a search index in batches.
+
+    Documents are read upload_batch_size at a time, embedded in embed_batch_size batches with up to concurrency
+    requests in flight and uploaded with retries for the documents that failed. With a manifest_path the content
+    hash of every indexed document's fields is stored, so a rerun skips unchanged documents and resumes after a
+    failure. In merge mode Azure AI Search only gets the fields that changed since the manifest was written, and only
+    documents with a changed content are embedded again.
+    """
+
+    def __init__(self, search_index: "AzureSearch | LocalSearchIndex", embeddings: Optional[Embeddings], mode: WriteMode = "upsert",
+                 embed_batch_size: int = 16, upload_batch_size: int = 500, concurrency: int = 4, max_retries: int = 3,
+                 retry_delay: float = 1.0, manifest_path: Optional[str] = None):
+        self.search_index = search_index
+        self.embeddings = embeddings
+        self.mode = mode
+        self.embed_batch_size = embed_batch_size
+        self.upload_batch_size = upload_batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.manifest_path = manifest_path
+        self.manifest: dict[str, dict[str, str]] = {}
+        if manifest_path and os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def _save_manifest(self):
+        if not self.manifest_path:
+            return
+        with open(f"{self.manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(f"{self.manifest_path}.tmp", self.manifest_path)
+
+    async def _embed(self, texts: list[str]) -> Optional[list[list[float]]]:
+        if self.embeddings is None:
+            return None
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def embed_batch(batch: list[str]) -> list[list[float]]:
+            async with semaphore:
+                return await self.embeddings.aembed_documents(batch)
+
+        batches = await asyncio.gather(*(embed_batch(batch) for batch in batched(texts, self.embed_batch_size)))
+        return [vector for batch in batches for vector in batch]
+
+    def _changed_fields(self, doc: Document) -> tuple[str, ...]:
+        """Returns the fields to write, all of them unless a merge into Azure AI Search can leave some out."""
+        previous = self.manifest.get(doc.id)
+        if self.mode != "merge" or isinstance(self.search_index, LocalSearchIndex) or not isinstance(previous, dict):
+            return _FIELDS
+        fingerprint = _fingerprint(doc)
+        return tuple(name for name in _FIELDS if previous.get(name) != fingerprint[name])
+
+    async def _upload_azure(self, docs: list[Document], vectors: dict[str, list[float]]) -> list[str]:
+        from azure.core.exceptions import HttpResponseError
+        from langchain_community.vectorstores.azuresearch import FIELDS_CONTENT, FIELDS_CONTENT_VECTOR, FIELDS_ID, FIELDS_METADATA
+
+        pending = {}
+        for doc in docs:
+            # Same key encoding as AzureSearch.add_texts, so both paths address the same documents
+            document = {FIELDS_ID: base64.urlsafe_b64encode(doc.id.encode("utf-8")).decode("ascii")}
+            fields = self._changed_fields(doc)
+            if "content" in fields:
+                document[FIELDS_CONTENT] = doc.page_content
+                document[FIELDS_CONTENT_VECTOR] = vectors[doc.id]
+            if "metadata" in fields:
+                document[FIELDS_METADATA] = json.dumps(doc.metadata)
+            pending[doc.id] = document
+        encoded = {document[FIELDS_ID]: doc_id for doc_id, document in pending.items()}
+        client = self.search_index.async_client
+        upload = client.merge_or_upload_documents if self.mode == "merge" else client.upload_documents
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                results = await upload(documents=list(pending.values()))
+            except HttpResponseError as e:
+                logger.warning("Upload of %d documents failed (attempt %d): %s", len(pending), attempt + 1, e)
+                continue
+            succeeded = {encoded[result.key] for result in results if result.succeeded}
+            pending = {doc_id: document for doc_id, document in pending.items() if doc_id not in succeeded}
+            if not pending:
+                break
+            logger.warning("%d documents were not indexed (attempt %d)", len(pending), attempt + 1)
+        return list(pending)
+
+    async def _upload(self, docs: list[Document], vectors: Optional[dict[str, list[float]]]) -> list[str]:
+        if isinstance(self.search_index, LocalSearchIndex):
+            texts, metadatas, keys = [doc.page_content for doc in docs], [doc.metadata for doc in docs], [doc.id for doc in docs]
+            merge = self.mode == "merge"
+            if vectors is None:
+                self.search_index.add_texts(texts, metadatas, keys, merge=merge)
+            else:
+                self.search_index.add_embeddings([(doc.page_content, vectors[doc.id]) for doc in docs], metadatas, keys, merge=merge)
+            return []
+        return await self._upload_azure(docs, vectors)
+
+    async def index(self, docs: Iterable[Document]) -> BulkIndexResult:
+        result = BulkIndexResult()
+        for batch in batched(docs, self.upload_batch_size):
+            changed = [doc for doc in batch if self.manifest.get(doc.id) != _fingerprint(doc)]
+            result.skipped += len(batch) - len(changed)
+            if not changed:
+                continue
+            to_embed = [doc for doc in changed if "content" in self._changed_fields(doc)]
+            embedded = await self._embed([doc.page_content for doc in to_embed])
+            vectors = None if embedded is None else {doc.id: vector for doc, vector in zip(to_embed, embedded)}
+            failed = set(await self._upload(changed, vectors))
+            for doc in changed:
+                if doc.id not in failed:
+                    self.manifest[doc.id] = _fingerprint(doc)
+            result.indexed += len(changed) - len(failed)
+            result.failed.extend(failed)
+            self._save_manifest()
+        return result
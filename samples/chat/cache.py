@@ -0,0 +1,92 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+from langchain_core.embeddings import Embeddings
+
+_MISSING = object()
+
+def normalize_query(query: str) -> str:
+    """Lowercases and collapses whitespace and trailing punctuation, so near identical queries share an entry."""
+    return re.sub(r"\s+", " ", query).strip().strip("?!.").strip().lower()
+
+class TTLCache:
+    """Thread safe LRU cache whose entries expire ttl seconds after they were stored."""
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that remember query vectors, documents are always embedded by the wrapped model."""
+
+    def __init__(self, embeddings: Embeddings, cache: Optional[TTLCache] = None):
+        self.embeddings = embeddings
+        self.cache = cache or TTLCache(ttl=3600.0, max_entries=4096)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key, _MISSING)
+        if vector is _MISSING:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key, _MISSING)
+        if vector is _MISSING:
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.put(key, vector)
+        return vector
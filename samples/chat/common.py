@@ -1,5 +1,9 @@
-from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from typing import Callable
+import functools
 
+# One credential and token cache per process, every client shares it
+@functools.cache
 def get_default_token_provider() -> Callable[[], str]:
+    # azure.identity pulls in msal and cryptography, only pay for it once a credential is needed
+    from azure.identity import DefaultAzureCredential, get_bearer_token_provider
     return get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
\ No newline at end of file
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from aiohttp import web
+
+class FakeOpenAIServer:
+    """Local OpenAI compatible chat completions endpoint with a requests per minute limit, for testing clients offline.
+
+    Requests over the limit get a 429 with retry-after-ms like Azure OpenAI sends. Serves both the Azure
+    /openai/deployments/{deployment}/chat/completions and the OpenAI /v1/chat/completions routes.
+    """
+
+    def __init__(self, requests_per_minute: int = 60, latency: float = 0.05, content: str = "This is a fake answer."):
+        self.requests_per_minute = requests_per_minute
+        self.latency = latency
+        self.content = content
+        self.served = 0
+        self.throttled = 0
+        self._window: deque[float] = deque()
+        self._ids = itertools.count()
+        self._cached_prefixes: set[int] = set()
+
+    def _cached_tokens(self, prompt: str) -> int:
+        """Mimics the prompt cache of Azure OpenAI: prompts from 1024 tokens on, matched in 128 token blocks."""
+        blocks = len(prompt) // 512
+        cached = 0
+        for block in range(1, blocks + 1):
+            prefix = hash(prompt[:block * 512])
+            if prefix in self._cached_prefixes and cached == block - 1:
+                cached = block
+            self._cached_prefixes.add(prefix)
+        return cached * 128 if len(prompt) // 4 >= 1024 else 0
+
+    def _retry_after(self) -> float:
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 60:
+            self._window.popleft()
+        if len(self._window) < self.requests_per_minute:
+            self._window.append(now)
+            return 0.0
+        return 60 - (now - self._window[0])
+
+    async def _chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        retry_after = self._retry_after()
+        if retry_after > 0:
+            self.throttled += 1
+            return web.json_response(
+                {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                status=429, headers={"retry-after-ms": str(int(retry_after * 1000)), "retry-after": str(int(retry_after) + 1)},
+            )
+        await asyncio.sleep(self.latency)
+        self.served += 1
+        prompt = json.dumps(body.get("messages", []))
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(self.content) // 4
+        cached_tokens = self._cached_tokens(prompt)
+        return web.json_response({
+            "id": f"chatcmpl-fake-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": self.content}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        })
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/openai/deployments/{deployment}/chat/completions", self._chat_completions)
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs a fake OpenAI compatible chat completions server.")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--rpm", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    web.run_app(FakeOpenAIServer(args.rpm, args.latency).create_app(), host="127.0.0.1", port=args.port)
@@ -0,0 +1,181 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(text.lower()) if text else []
+
+class LocalSearchIndex:
+    """In process hybrid search index with the add_texts and similarity_search API of AzureSearch.
+
+    Ranks with BM25 over the page content and, if embeddings are given, cosine similarity over the document vectors,
+    fused with reciprocal rank fusion. Filters match metadata fields such as topic and subject exactly. Documents and
+    vectors are persisted to a JSON and a NumPy file in directory and loaded again on start.
+    """
+
+    k1: float = 1.2
+    b: float = 0.75
+    rrf_k: int = 60
+
+    def __init__(self, index_name: str, embeddings: Optional[Embeddings] = None, directory: Optional[str] = None):
+        self.index_name = index_name
+        self.embeddings = embeddings
+        self.directory = directory
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._load()
+        self._build_lexical_index()
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.index_name}{suffix}")
+
+    def _load(self):
+        if self.directory is None or not os.path.exists(self._path(".json")):
+            return
+        with open(self._path(".json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self._ids, self._texts, self._metadatas = data["ids"], data["texts"], data["metadatas"]
+        if os.path.exists(self._path(".npy")):
+            self._vectors = np.load(self._path(".npy"))
+
+    def _save(self):
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Write next to the target and swap, so a crash never leaves a half written index
+        with open(self._path(".json.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"ids": self._ids, "texts": self._texts, "metadatas": self._metadatas}, f)
+        os.replace(self._path(".json.tmp"), self._path(".json"))
+        if self._vectors is not None:
+            with open(self._path(".npy.tmp"), "wb") as f:
+                np.save(f, self._vectors)
+            os.replace(self._path(".npy.tmp"), self._path(".npy"))
+
+    def _build_lexical_index(self):
+        self._postings: dict[str, dict[int, int]] = defaultdict(dict)
+        self._lengths: list[int] = []
+        for doc_id, text in enumerate(self._texts):
+            tokens = tokenize(text)
+            self._lengths.append(len(tokens))
+            for token in tokens:
+                self._postings[token][doc_id] = self._postings[token].get(doc_id, 0) + 1
+        count = len(self._texts)
+        self._avg_length = sum(self._lengths) / count if count else 0.0
+        self._idf = {token: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)) for token, postings in self._postings.items()}
+
+    def add_texts(self, texts: list[str], metadatas: Optional[list[dict]] = None, keys: Optional[list[str]] = None, merge: bool = False, **kwargs) -> list[str]:
+        """Adds or replaces documents by key and persists the index."""
+        vectors = self.embeddings.embed_documents(list(texts)) if self.embeddings is not None and texts else None
+        return self._upsert(texts, vectors, metadatas, keys, merge)
+
+    def add_embeddings(self, text_embeddings: list[tuple[str, list[float]]], metadatas: Optional[list[dict]] = None,
+                       keys: Optional[list[str]] = None, merge: bool = False) -> list[str]:
+        """Like add_texts for documents that were embedded already, merge updates the metadata of existing documents."""
+        texts = [text for text, _ in text_embeddings]
+        return self._upsert(texts, [vector for _, vector in text_embeddings], metadatas, keys, merge)
+
+    @staticmethod
+    def _normalize(vectors: list[list[float]]) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _vector_matrix(self, rows: list[int], vectors: np.ndarray) -> np.ndarray:
+        """Returns the vectors of all documents with vectors[i] at position rows[i], documents without one are embedded."""
+        matrix = np.zeros((len(self._ids), vectors.shape[1]), dtype=np.float32)
+        known = np.zeros(len(self._ids), dtype=bool)
+        if self._vectors is not None:
+            matrix[:len(self._vectors)] = self._vectors
+            known[:len(self._vectors)] = True
+        matrix[rows] = vectors
+        known[rows] = True
+        missing = np.flatnonzero(~known)
+        if missing.size:
+            matrix[missing] = self._normalize(self.embeddings.embed_documents([self._texts[i] for i in missing]))
+        return matrix
+
+    def _upsert(self, texts: list[str], vectors: Optional[list[list[float]]], metadatas: Optional[list[dict]], keys: Optional[list[str]], merge: bool) -> list[str]:
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        keys = keys or [str(len(self._ids) + i) for i in range(len(texts))]
+        if vectors is not None:
+            vectors = self._normalize(vectors)
+
+        with self._lock:
+            # Row i of the vectors always belongs to document i, an index has vectors for all documents or for none
+            if vectors is None and self._vectors is not None:
+                raise ValueError(f"Index {self.index_name} has document vectors, add documents with embeddings.")
+            if vectors is not None and self._vectors is None and self.embeddings is None and set(self._ids) - set(keys):
+                raise ValueError(f"Index {self.index_name} has documents without vectors and no embeddings to add them.")
+            positions = {key: i for i, key in enumerate(self._ids)}
+            rows = []
+            for key, text, metadata in zip(keys, texts, metadatas):
+                if key in positions:
+                    position = positions[key]
+                    self._texts[position] = text
+                    self._metadatas[position] = {**self._metadatas[position], **metadata} if merge else metadata
+                else:
+                    position = positions[key] = len(self._ids)
+                    self._ids.append(key)
+                    self._texts.append(text)
+                    self._metadatas.append(metadata)
+                rows.append(position)
+            if vectors is not None and rows:
+                self._vectors = self._vector_matrix(rows, vectors)
+            self._build_lexical_index()
+            self._save()
+        return list(keys)
+
+    def _matches(self, doc_id: int, filters: Optional[dict]) -> bool:
+        return not filters or all(self._metadatas[doc_id].get(field) == value for field, value in filters.items())
+
+    def _lexical_ranking(self, query: str, filters: Optional[dict]) -> list[int]:
+        scores: dict[int, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            for doc_id, frequency in self._postings.get(token, {}).items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / self._avg_length)
+                scores[doc_id] += self._idf[token] * frequency * (self.k1 + 1) / (frequency + norm)
+        return [doc_id for doc_id, _ in sorted(scores.items(), key=lambda entry: (-entry[1], entry[0])) if self._matches(doc_id, filters)]
+
+    def _vector_ranking(self, query_vector: list[float], filters: Optional[dict]) -> list[int]:
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1
+        scores = self._vectors @ vector
+        return [int(doc_id) for doc_id in np.argsort(-scores) if self._matches(int(doc_id), filters)]
+
+    def _search(self, query: str, query_vector: Optional[list[float]], k: int, search_type: str, filters: Optional[dict]) -> list[Document]:
+        with self._lock:
+            rankings = []
+            if search_type != "similarity" or query_vector is None:
+                rankings.append(self._lexical_ranking(query, filters))
+            if query_vector is not None and self._vectors is not None:
+                rankings.append(self._vector_ranking(query_vector, filters))
+
+            fused: dict[int, float] = defaultdict(float)
+            for ranking in rankings:
+                for rank, doc_id in enumerate(ranking):
+                    fused[doc_id] += 1 / (self.rrf_k + rank + 1)
+            top = sorted(fused.items(), key=lambda entry: (-entry[1], entry[0]))[:k]
+            return [Document(id=self._ids[doc_id], page_content=self._texts[doc_id], metadata=dict(self._metadatas[doc_id])) for doc_id, _ in top]
+
+    def similarity_search(self, query: str, k: int = 4, search_type: str = "hybrid", filters: Optional[dict] = None, **kwargs) -> list[Document]:
+        query_vector = self.embeddings.embed_query(query) if self.embeddings is not None and search_type != "bm25" else None
+        return self._search(query, query_vector, k, search_type, filters)
+
+    async def asimilarity_search(self, query: str, k: int = 4, search_type: str = "hybrid", filters: Optional[dict] = None, **kwargs) -> list[Document]:
+        query_vector = await self.embeddings.aembed_query(query) if self.embeddings is not None and search_type != "bm25" else None
+        # Ranking is CPU only and sub millisecond for small corpora, no need to leave the loop
+        return self._search(query, query_vector, k, search_type, filters)
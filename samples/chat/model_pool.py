@@ -0,0 +1,237 @@
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Iterator, Literal, Optional
+import httpx
+from samples.chat.common import get_default_token_provider
+
+if TYPE_CHECKING:
+    from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+
+logger = logging.getLogger(__name__)
+
+# User facing turns are granted capacity before background work such as indexing or summaries
+Lane = Literal["interactive", "background"]
+LANE_PRIORITY: dict[str, int] = {"interactive": 0, "background": 1}
+
+_current_lane: contextvars.ContextVar[str] = contextvars.ContextVar("model_lane", default="interactive")
+
+@contextmanager
+def model_lane(lane: Lane) -> Iterator[None]:
+    """Runs the model calls made within the block in the given lane."""
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+def estimate_request_tokens(request: httpx.Request, default_max_tokens: int = 512) -> int:
+    """Estimates the tokens a request is charged with like the service does: prompt characters / 4 plus max_tokens."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except (ValueError, httpx.RequestNotRead):
+        return default_max_tokens
+    prompt = json.dumps(body.get("messages", body.get("input", "")))
+    return len(prompt) // 4 + int(body.get("max_tokens") or body.get("max_completion_tokens") or default_max_tokens)
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    if "retry-after-ms" in response.headers:
+        return float(response.headers["retry-after-ms"]) / 1000
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+
+class TokenBucketLimiter:
+    """Token buckets for requests and tokens per minute that grant capacity by lane priority, then arrival order.
+
+    Waiters are asyncio tasks, the state is locked so tasks on the event loops of several threads can share it.
+    pause() blocks every lane, e.g. for the retry-after of a 429.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float, burst_seconds: float = 10.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Azure OpenAI enforces its per minute quotas over shorter windows, so only a few seconds of quota may burst
+        self.max_requests = max(1.0, requests_per_minute * burst_seconds / 60)
+        self.max_tokens = max(1.0, tokens_per_minute * burst_seconds / 60)
+        self._requests = self.max_requests
+        self._tokens = self.max_tokens
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.max_requests, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.max_tokens, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def _try_grant(self, waiter: tuple[int, int], tokens: int) -> float:
+        """Grants the capacity and returns 0, or returns how long to wait before trying again."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._waiters[0] != waiter:
+            # Someone with a higher priority or an earlier arrival is served first
+            return 0.05
+        # Requests larger than the bucket are granted once it is full
+        tokens = min(tokens, self.max_tokens)
+        missing_requests = max(0.0, 1 - self._requests) * 60 / self.requests_per_minute
+        missing_tokens = max(0.0, tokens - self._tokens) * 60 / self.tokens_per_minute
+        wait = max(missing_requests, missing_tokens)
+        if wait > 0:
+            return wait
+        self._requests -= 1
+        self._tokens -= tokens
+        heapq.heappop(self._waiters)
+        self.granted += 1
+        return 0.0
+
+    def _enqueue(self, lane: str) -> tuple[int, int]:
+        waiter = (LANE_PRIORITY.get(lane, 0), next(self._sequence))
+        heapq.heappush(self._waiters, waiter)
+        return waiter
+
+    async def aacquire(self, tokens: int, lane: str = "interactive"):
+        started = time.monotonic()
+        with self._lock:
+            waiter = self._enqueue(lane)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_grant(waiter, tokens)
+                if wait == 0:
+                    break
+                # Poll in short steps so a waiter that got ahead of us is noticed
+                await asyncio.sleep(min(wait, 0.05))
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+            raise
+        with self._lock:
+            self.waited_seconds += time.monotonic() - started
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Async httpx transport that takes capacity from the limiter before each request and retries 429 responses.
+
+    The wait honours the retry-after headers of the service and pauses all requests of the pool meanwhile.
+    """
+
+    def __init__(self, limiter: TokenBucketLimiter, transport: httpx.AsyncBaseTransport, max_retries: int = 5,
+                 backoff: float = 1.0):
+        self.limiter = limiter
+        self.transport = transport
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.throttled = 0
+        # Prompt tokens of the completed requests and the share the service served from its prompt cache
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self._lock = threading.Lock()
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        delay = retry_after_seconds(response)
+        return delay if delay is not None else self.backoff * 2 ** attempt
+
+    def _record_usage(self, response: httpx.Response):
+        try:
+            usage = response.json().get("usage") or {}
+        except ValueError:
+            return
+        with self._lock:
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.cached_tokens += (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+
+    @staticmethod
+    def _has_usage(response: httpx.Response) -> bool:
+        # Streamed responses are passed through untouched
+        return response.status_code == 200 and response.headers.get("content-type", "").startswith("application/json")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tokens = estimate_request_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire(tokens, _current_lane.get())
+            response = await self.transport.handle_async_request(request)
+            if self._has_usage(response):
+                await response.aread()
+                self._record_usage(response)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            self.throttled += 1
+            delay = self._retry_delay(response, attempt)
+            await response.aclose()
+            logger.warning("Model request throttled, retrying in %.2fs", delay)
+            self.limiter.pause(delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class ModelClientPool:
+    """Model clients of one process that share the HTTP connections, the credential and the rate limits."""
+
+    def __init__(self, requests_per_minute: float = 300, tokens_per_minute: float = 100_000, max_connections: int = 20, max_retries: int = 5):
+        self.limiter = TokenBucketLimiter(requests_per_minute, tokens_per_minute)
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.transport = RateLimitedTransport(self.limiter, httpx.AsyncHTTPTransport(limits=limits), max_retries=max_retries)
+        self.http_client = httpx.AsyncClient(transport=self.transport, timeout=httpx.Timeout(60.0, connect=10.0))
+        self._clients: dict[tuple, "AzureOpenAIChatCompletionClient"] = {}
+        self._lock = threading.Lock()
+
+    def chat_client(self, **kwargs) -> "AzureOpenAIChatCompletionClient":
+        """Returns the client for these settings, created once. Without an api_key the shared credential is used."""
+        from autogen_ext.models.openai import AzureOpenAIChatCompletionClient
+        key = tuple(sorted((k, json.dumps(v, sort_keys=True, default=str)) for k, v in kwargs.items()))
+        with self._lock:
+            if key not in self._clients:
+                options = {k: v for k, v in kwargs.items() if v is not None}
+                if "api_key" not in options:
+                    options["azure_ad_token_provider"] = get_default_token_provider()
+                # The transport retries throttled requests with the service's retry-after, the SDK does not need to
+                self._clients[key] = AzureOpenAIChatCompletionClient(http_client=self.http_client, max_retries=0, **options)
+            return self._clients[key]
+
+    def stats(self) -> dict:
+        prompt_tokens, cached_tokens = self.transport.prompt_tokens, self.transport.cached_tokens
+        return {
+            "granted": self.limiter.granted,
+            "waited_seconds": round(self.limiter.waited_seconds, 3),
+            "throttled": self.transport.throttled,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "cached_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+        }
+
+    async def close(self):
+        await self.http_client.aclose()
+
+@functools.cache
+def get_model_pool() -> ModelClientPool:
+    return ModelClientPool(
+        requests_per_minute=float(os.getenv("MODEL_POOL_RPM", 300)),
+        tokens_per_minute=float(os.getenv("MODEL_POOL_TPM", 100_000)),
+        max_connections=int(os.getenv("MODEL_POOL_MAX_CONNECTIONS", 20)),
+    )
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncGenerator, List, Mapping, Optional, Sequence, Union
+import numpy as np
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, RequestUsage, UserMessage
+from autogen_core.tools import Tool, ToolSchema
+from autogen_ext.models.cache import ChatCompletionCache
+from langchain_core.embeddings import Embeddings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    value TEXT NOT NULL,
+    vector BLOB,
+    latency REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope, created_at);
+"""
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class ResponseStore:
+    """Model responses in a local SQLite database, entries expire ttl seconds after they were written.
+
+    Every entry has an exact key and a scope. Entries of the same scope can also be found by the similarity of a
+    vector, e.g. the embedding of the last user message.
+    """
+
+    def __init__(self, path: str = "responses.sqlite", ttl: float = 24 * 3600):
+        self.ttl = ttl
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        # Latency of the original model calls that hits answered instead
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _hit(self, row: tuple, similar: bool) -> Any:
+        with self._lock:
+            self.hits += 1
+            self.similar_hits += similar
+            self.saved_seconds += row[1]
+        return json.loads(row[0])
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, latency FROM responses WHERE key = ? AND created_at >= ?", (key, time.time() - self.ttl)
+            ).fetchone()
+        return self._hit(row, similar=False) if row is not None else None
+
+    def get_similar(self, scope: str, vector: np.ndarray, threshold: float) -> Any:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT value, latency, vector FROM responses WHERE scope = ? AND created_at >= ? AND vector IS NOT NULL",
+                (scope, time.time() - self.ttl),
+            ).fetchall()
+        if not rows:
+            return None
+        scores = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows]) @ vector
+        best = int(np.argmax(scores))
+        return self._hit(rows[best], similar=True) if scores[best] >= threshold else None
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key: str, scope: str, value: Any, latency: float, vector: Optional[np.ndarray] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, value, vector, latency, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, scope, json.dumps(value), vector.tobytes() if vector is not None else None, latency, time.time()),
+            )
+
+    def cleanup(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+    def close(self):
+        self._conn.close()
+
+class CachedChatCompletionClient(ChatCompletionCache):
+    """ChatCompletionCache over a ResponseStore, for agents whose turns are deterministic given their messages.
+
+    The exact key covers the deployment, model, temperature and other create arguments, the tools and the messages.
+    With embeddings, a miss falls back to the entry with the same key apart from the last user message whose text is
+    at least similarity_threshold similar. Hits report cached=True and no usage.
+    """
+
+    def __init__(self, client: ChatCompletionClient, store: ResponseStore, embeddings: Optional[Embeddings] = None,
+                 similarity_threshold: float = 0.95):
+        super().__init__(client)
+        self.store = store
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+
+    def _keys(self, messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema], json_output: Optional[bool],
+              extra_create_args: Mapping[str, Any]) -> tuple[str, str, Optional[str]]:
+        """Returns the exact key, the scope without the last user message and the text of that message."""
+        settings = {
+            "deployment": getattr(self.client, "_raw_config", {}).get("azure_deployment"),
+            **getattr(self.client, "_create_args", {}),
+            **extra_create_args,
+            "json_output": json_output,
+            "tools": [tool.schema if isinstance(tool, Tool) else tool for tool in tools],
+        }
+        dumped = [message.model_dump() for message in messages]
+        key = _hash([settings, dumped])
+        last = next((i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], UserMessage)), None)
+        if last is None or not isinstance(messages[last].content, str):
+            return key, "", None
+        return key, _hash([settings, dumped[:last], dumped[last + 1:]]), messages[last].content
+
+    async def _lookup(self, key: str, scope: str, text: Optional[str]) -> tuple[Any, Optional[np.ndarray]]:
+        value = self.store.get(key)
+        if value is not None:
+            return value, None
+        vector = None
+        if self.embeddings is not None and text:
+            vector = np.asarray(await self.embeddings.aembed_query(text), dtype=np.float32)
+            vector /= np.linalg.norm(vector) or 1
+            value = self.store.get_similar(scope, vector, self.similarity_threshold)
+            if value is not None:
+                return value, None
+        self.store.miss()
+        return None, vector
+
+    @staticmethod
+    def _cached_result(value: dict) -> CreateResult:
+        return CreateResult.model_validate({**value, "cached": True, "usage": RequestUsage(prompt_tokens=0, completion_tokens=0)})
+
+    async def create(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = [], json_output: Optional[bool] = None,
+                     extra_create_args: Mapping[str, Any] = {}, cancellation_token: Optional[CancellationToken] = None) -> CreateResult:
+        key, scope, text = self._keys(messages, tools, json_output, extra_create_args)
+        value, vector = await self._lookup(key, scope, text)
+        if value is not None:
+            return self._cached_result(value["result"])
+
+        started = time.perf_counter()
+        result = await self.client.create(messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args,
+                                          cancellation_token=cancellation_token)
+        self.store.put(key, scope, {"chunks": [], "result": result.model_dump(mode="json")}, time.perf_counter() - started, vector)
+        return result
+
+    def create_stream(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = [], json_output: Optional[bool] = None,
+                      extra_create_args: Mapping[str, Any] = {},
+                      cancellation_token: Optional[CancellationToken] = None) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def _generator() -> AsyncGenerator[Union[str, CreateResult], None]:
+            key, scope, text = self._keys(messages, tools, json_output, extra_create_args)
+            value, vector = await self._lookup(key, scope, text)
+            if value is not None:
+                for chunk in value["chunks"]:
+                    yield chunk
+                yield self._cached_result(value["result"])
+                return
+
+            started = time.perf_counter()
+            chunks: List[str] = []
+            async for chunk in self.client.create_stream(messages, tools=tools, json_output=json_output,
+                                                         extra_create_args=extra_create_args, cancellation_token=cancellation_token):
+                if isinstance(chunk, CreateResult):
+                    # Stored once the stream completed, an interrupted stream is never replayed
+                    self.store.put(key, scope, {"chunks": chunks, "result": chunk.model_dump(mode="json")}, time.perf_counter() - started, vector)
+                else:
+                    chunks.append(chunk)
+                yield chunk
+
+        return _generator()
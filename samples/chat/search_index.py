@@ -1,32 +1,124 @@
-from langchain_community.vectorstores.azuresearch import AzureSearch
+import asyncio
+import functools
 import os
-from langchain_openai import AzureOpenAIEmbeddings
+import threading
 from samples.chat.common import get_default_token_provider
 from samples.chat.model import Document
+from samples.chat.cache import CachedEmbeddings, TTLCache, normalize_query
+from samples.chat.local_index import LocalSearchIndex
+from samples.chat.bulk_index import BulkIndexer, BulkIndexResult, WriteMode
+from typing import TYPE_CHECKING, Iterable
 
-embeddings_model = AzureOpenAIEmbeddings(    
-    azure_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
-    openai_api_version = os.getenv("AZURE_OPENAI_API_VERSION"),
-    model= os.getenv("AZURE_OPENAI_EMBEDDING_MODEL"),
-    azure_ad_token_provider=get_default_token_provider(),
-)
+if TYPE_CHECKING:
+    from langchain_community.vectorstores.azuresearch import AzureSearch
+    from langchain_openai import AzureOpenAIEmbeddings
 
-def aquire_search_index(index_name: str) -> AzureSearch:
+@functools.cache
+def get_embeddings_model() -> "AzureOpenAIEmbeddings":
+    # Imported and created on first use, an offline local index without embeddings never needs the deployment settings
+    from langchain_openai import AzureOpenAIEmbeddings
+    return AzureOpenAIEmbeddings(
+        azure_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+        openai_api_version = os.getenv("AZURE_OPENAI_API_VERSION"),
+        model= os.getenv("AZURE_OPENAI_EMBEDDING_MODEL"),
+        azure_ad_token_provider=get_default_token_provider(),
+    )
+
+# "azure" for Azure AI Search, "local" for the in process index persisted to SEARCH_LOCAL_DIRECTORY
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "azure")
+
+# Query text -> embedding, and (index, query, k, search_type, filters) -> results
+query_embedding_cache = TTLCache(ttl=float(os.getenv("SEARCH_EMBEDDING_CACHE_TTL", 3600)), max_entries=int(os.getenv("SEARCH_EMBEDDING_CACHE_SIZE", 4096)))
+search_results = TTLCache(ttl=float(os.getenv("SEARCH_RESULT_CACHE_TTL", 300)), max_entries=int(os.getenv("SEARCH_RESULT_CACHE_SIZE", 1024)))
+
+# One client per index for the whole process, creating one checks the index and opens new connections
+_search_indexes: dict[str, "AzureSearch | LocalSearchIndex"] = {}
+_search_indexes_lock = threading.Lock()
+
+@functools.cache
+def get_query_embeddings() -> CachedEmbeddings:
+    return CachedEmbeddings(get_embeddings_model(), query_embedding_cache)
+
+def _create_search_index(index_name: str) -> "AzureSearch | LocalSearchIndex":
+    if SEARCH_BACKEND == "local":
+        return LocalSearchIndex(
+            index_name,
+            # Without embeddings the local index ranks with BM25 only and runs fully offline
+            embeddings=get_query_embeddings() if os.getenv("SEARCH_LOCAL_EMBEDDINGS", "true").lower() == "true" else None,
+            directory=os.getenv("SEARCH_LOCAL_DIRECTORY", ".search_index"),
+        )
+    # The Azure AI Search client and its dependencies take most of the import time of this module
+    from langchain_community.vectorstores.azuresearch import AzureSearch
     return AzureSearch(
         azure_search_endpoint=os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
         azure_search_key=os.getenv("AZURE_AI_SEARCH_KEY"),
         index_name=index_name,
-        embedding_function=embeddings_model.embed_query,
+        # The embeddings object, not embed_query, so async searches embed without blocking the loop
+        embedding_function=get_query_embeddings(),
     )
 
-def index_documents(search_index_name: str, docs) -> None:
-    search_index = aquire_search_index(search_index_name)
-    search_index.add_texts(
-        keys=[doc.id for doc in docs],
-        texts=[doc.page_content for doc in docs],
-        metadatas=[doc.metadata for doc in docs],
-    )
+def aquire_search_index(index_name: str) -> "AzureSearch | LocalSearchIndex":
+    with _search_indexes_lock:
+        if index_name not in _search_indexes:
+            _search_indexes[index_name] = _create_search_index(index_name)
+        return _search_indexes[index_name]
+
+async def close_search_indexes() -> None:
+    with _search_indexes_lock:
+        indexes = list(_search_indexes.values())
+        _search_indexes.clear()
+    for index in indexes:
+        if isinstance(index, LocalSearchIndex):
+            continue
+        index.client.close()
+        await index.async_client.close()
 
-def search_index(search_index_name: str, query: str, k: int = 5) -> list[Document]:
+def search_cache_stats() -> dict:
+    return {"embeddings": query_embedding_cache.stats(), "results": search_results.stats()}
+
+async def aindex_documents(search_index_name: str, docs: Iterable[Document], mode: WriteMode = "upsert", **options) -> BulkIndexResult:
+    """Indexes documents in embedding and upload batches, options are passed on to BulkIndexer."""
     search_index = aquire_search_index(search_index_name)
-    return search_index.similarity_search(query, k=k, search_type="hybrid")
\ No newline at end of file
+    local_without_embeddings = isinstance(search_index, LocalSearchIndex) and search_index.embeddings is None
+    indexer = BulkIndexer(search_index, None if local_without_embeddings else get_embeddings_model(), mode=mode, **options)
+    try:
+        return await indexer.index(docs)
+    finally:
+        # Cached results of this index may miss or contain stale versions of the written documents
+        search_results.invalidate(lambda key: key[0] == search_index_name)
+
+def index_documents(search_index_name: str, docs: Iterable[Document], mode: WriteMode = "upsert", **options) -> BulkIndexResult:
+    return asyncio.run(aindex_documents(search_index_name, docs, mode, **options))
+
+def _filter_results(search_index, results: list, k: int, filters: dict | None) -> list:
+    if not filters or isinstance(search_index, LocalSearchIndex):
+        return results
+    # Azure AI Search stores the metadata as one string field, so topic and subject are matched on the results
+    return [doc for doc in results if all(doc.metadata.get(field) == value for field, value in filters.items())][:k]
+
+def search_index(search_index_name: str, query: str, k: int = 5, search_type: str = "hybrid", filters: dict | None = None) -> list[Document]:
+    """Searches the index, filters match metadata fields such as topic and subject exactly."""
+    key = (search_index_name, normalize_query(query), k, search_type, tuple(sorted((filters or {}).items())))
+    results = search_results.get(key)
+    if results is None:
+        search_index = aquire_search_index(search_index_name)
+        if isinstance(search_index, LocalSearchIndex):
+            results = search_index.similarity_search(query, k=k, search_type=search_type, filters=filters)
+        else:
+            results = search_index.similarity_search(query, k=k * 4 if filters else k, search_type=search_type)
+        results = _filter_results(search_index, results, k, filters)
+        search_results.put(key, results)
+    return list(results)
+
+async def asearch_index(search_index_name: str, query: str, k: int = 5, search_type: str = "hybrid", filters: dict | None = None) -> list[Document]:
+    key = (search_index_name, normalize_query(query), k, search_type, tuple(sorted((filters or {}).items())))
+    results = search_results.get(key)
+    if results is None:
+        search_index = aquire_search_index(search_index_name)
+        if isinstance(search_index, LocalSearchIndex):
+            results = await search_index.asimilarity_search(query, k=k, search_type=search_type, filters=filters)
+        else:
+            results = await search_index.asimilarity_search(query, k=k * 4 if filters else k, search_type=search_type)
+        results = _filter_results(search_index, results, k, filters)
+        search_results.put(key, results)
+    return list(results)
@@ -0,0 +1,64 @@
+import re
+import threading
+from typing import Sequence
+from autogen_agentchat.messages import AgentEvent, BaseAgentEvent, ChatMessage
+
+APPROVAL_PATTERN = re.compile(r"\b(yes|ok|okay|approved?|looks good|go ahead|send|select|take|choose|use|perfect|fine|#?\d+)\b", re.IGNORECASE)
+REVISION_PATTERN = re.compile(r"\b(no|change|modify|edit|rewrite|another|different|again|instead|more|less|add|remove)\b", re.IGNORECASE)
+
+class FlowSelector:
+    """Speaker selector for SelectorGroupChat that follows a linear flow of stages with the user in between.
+
+    stage -> user, user -> next stage on approval, user -> same stage on a revision request. Turns that match
+    neither or both return None, so SelectorGroupChat asks the model. Counts the selector model calls it avoided.
+    """
+
+    def __init__(self, stages: Sequence[str], user: str = "user_proxy",
+                 approval_pattern: re.Pattern = APPROVAL_PATTERN, revision_pattern: re.Pattern = REVISION_PATTERN):
+        self.stages = list(stages)
+        self.user = user
+        self.approval_pattern = approval_pattern
+        self.revision_pattern = revision_pattern
+        self.avoided_calls = 0
+        self.model_calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, messages: Sequence[AgentEvent | ChatMessage]) -> str | None:
+        speaker = self._select(messages)
+        with self._lock:
+            if speaker is None:
+                self.model_calls += 1
+            else:
+                self.avoided_calls += 1
+        return speaker
+
+    def _select(self, messages: Sequence[AgentEvent | ChatMessage]) -> str | None:
+        chat = [message for message in messages if not isinstance(message, BaseAgentEvent)]
+        stages_spoken = [message.source for message in chat if message.source in self.stages]
+        if not stages_spoken:
+            return self.stages[0]
+
+        last = chat[-1]
+        if last.source in self.stages:
+            # Every stage hands back to the user for a selection, approval or input
+            return self.user
+        if last.source != self.user or not isinstance(last.content, str):
+            return None
+
+        stage = self.stages.index(stages_spoken[-1])
+        approved = bool(self.approval_pattern.search(last.content))
+        revised = bool(self.revision_pattern.search(last.content))
+        if approved == revised:
+            return None
+        if revised:
+            return self.stages[stage]
+        return self.stages[min(stage + 1, len(self.stages) - 1)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.avoided_calls + self.model_calls
+            return {
+                "avoided_calls": self.avoided_calls,
+                "model_calls": self.model_calls,
+                "avoided_rate": self.avoided_calls / total if total else 0.0,
+            }
@@ -0,0 +1,23 @@
+import io
+import json
+import pytest
+from samples.chat.bulk_index import iter_json_array
+
+def _items(text: str, chunk_size: int) -> list:
+    return list(iter_json_array(io.StringIO(text), chunk_size))
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1 << 16])
+def test_items_split_across_chunks(chunk_size):
+    assert _items("[12345, 678]", chunk_size) == [12345, 678]
+    assert _items(' [ {"a": "],["}, -1.5e3 , true, null, "x" ] ', chunk_size) == [{"a": "],["}, -1500.0, True, None, "x"]
+    assert _items("[]", chunk_size) == []
+
+def test_templates_round_trip():
+    templates = [{"id": i, "body": "text " * i, "topic": "t", "subject": "s"} for i in range(50)]
+    assert _items(json.dumps(templates, indent=2), 5) == templates
+
+@pytest.mark.parametrize("text", ['[{"a":1} {"b":2}]', "[1,,2]", "[1,]", "[,1]", "[1 2]", "[1, 2", "{}", ""])
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 16])
+def test_malformed_arrays_are_rejected(text, chunk_size):
+    with pytest.raises(ValueError):
+        _items(text, chunk_size)
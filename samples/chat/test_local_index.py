@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+from samples.chat.local_index import LocalSearchIndex
+
+class KeywordEmbeddings(Embeddings):
+    """One dimension per keyword, so the expected cosine ranking is obvious."""
+
+    keywords = ["invoice", "holiday", "password"]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [float(keyword in text.lower()) for keyword in self.keywords]
+
+def _assert_aligned(index: LocalSearchIndex):
+    embeddings = KeywordEmbeddings()
+    assert index._vectors.shape[0] == len(index._ids)
+    for text, vector in zip(index._texts, index._vectors):
+        expected = np.asarray(embeddings.embed_query(text), dtype=np.float32)
+        assert np.allclose(vector, expected / (np.linalg.norm(expected) or 1))
+
+def test_vectors_added_to_persisted_index_without_vectors(tmp_path):
+    LocalSearchIndex("templates", directory=str(tmp_path)).add_texts(["Invoice reminder", "Holiday notice"], keys=["a", "b"])
+
+    index = LocalSearchIndex("templates", embeddings=KeywordEmbeddings(), directory=str(tmp_path))
+    index.add_texts(["Password reset"], keys=["c"])
+
+    _assert_aligned(index)
+    assert [doc.id for doc in index.similarity_search("holiday", k=1, search_type="similarity")] == ["b"]
+    _assert_aligned(LocalSearchIndex("templates", embeddings=KeywordEmbeddings(), directory=str(tmp_path)))
+
+def test_vectors_for_existing_keys_when_index_had_none(tmp_path):
+    LocalSearchIndex("templates", directory=str(tmp_path)).add_texts(["Invoice reminder", "Holiday notice"], keys=["a", "b"])
+
+    index = LocalSearchIndex("templates", directory=str(tmp_path))
+    embeddings = KeywordEmbeddings()
+    texts = ["Password reset", "Holiday notice"]
+    index.add_embeddings(list(zip(texts, embeddings.embed_documents(texts))), keys=["b", "a"])
+
+    assert index._texts == ["Holiday notice", "Password reset"]
+    _assert_aligned(index)
+    assert [doc.id for doc in index.similarity_search("password", k=1, search_type="similarity")] == ["b"]
+
+def test_mixed_vector_states_are_rejected(tmp_path):
+    LocalSearchIndex("templates", directory=str(tmp_path)).add_texts(["Invoice reminder"], keys=["a"])
+    index = LocalSearchIndex("templates", directory=str(tmp_path))
+    with pytest.raises(ValueError):
+        index.add_embeddings([("Holiday notice", [0.0, 1.0, 0.0])], keys=["b"])
+    assert index._ids == ["a"]
+
+    index = LocalSearchIndex("vectors", embeddings=KeywordEmbeddings())
+    index.add_texts(["Invoice reminder"], keys=["a"])
+    index.embeddings = None
+    with pytest.raises(ValueError):
+        index.add_texts(["Holiday notice"], keys=["b"])
+    assert index._ids == ["a"]
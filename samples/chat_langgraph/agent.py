@@ -1,30 +1,126 @@
-from typing import Any, Dict, List, Literal, Annotated, TypedDict, cast
+import asyncio
+import contextlib
+import functools
+from concurrent.futures import Executor
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable, Dict, Iterator, List, Literal, Optional, Annotated, TypedDict, cast
 from dataclasses import dataclass
 from langchain_core.prompts import PromptTemplate, ChatPromptTemplate
 from langgraph.graph import END, START, StateGraph
-from langgraph.prebuilt import ToolNode
 from langgraph.types import Command, interrupt
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain.output_parsers import PydanticOutputParser
 from langgraph.graph.message import AnyMessage, add_messages
-from langchain_core.runnables.config import RunnableConfig
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import RunnableConfig, ensure_config, merge_configs
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+from langchain_core.exceptions import OutputParserException
+from langchain_core.utils.json import parse_json_markdown, parse_partial_json
+from langgraph.config import get_stream_writer
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.utils.runnable import RunnableCallable
 from tracer import AppInsightsTracer
+from tool_node import ParallelToolNode
+from capabilities import CapabilityIndex
+from response_cache import hold_writes
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "parser" asks for the Route JSON as text and parses it, "structured" uses a native tool call for the route
+RoutingMode = Literal["parser", "structured"]
 
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
 
+def _partial_route_result(message: AIMessage, routing: RoutingMode, route_name: str, field: str = "result") -> Optional[str]:
+    """Extracts a field generated so far from a partially streamed or invalid route."""
+    if routing == "structured":
+        for tool_call in message.tool_calls:
+            if tool_call["name"] == route_name:
+                return tool_call["args"].get(field)
+        return None
+    try:
+        route = parse_json_markdown(message.content, parser=parse_partial_json)
+    except ValueError:
+        return None
+    return route.get(field) if isinstance(route, dict) else None
+
+def _stream_writer() -> Callable[[Any], None]:
+    """Returns the custom stream writer, or a no-op if the graph is not streamed in custom mode."""
+    try:
+        return get_stream_writer()
+    except KeyError:
+        return lambda chunk: None
+
+_node_executor: ContextVar[Optional[Executor]] = ContextVar("node_executor", default=None)
+
+@contextlib.contextmanager
+def node_executor(executor: Executor) -> Iterator[None]:
+    """Runs the agent nodes of the async graph runs started within the block on the given executor."""
+    token = _node_executor.set(executor)
+    try:
+        yield
+    finally:
+        _node_executor.reset(token)
+
+def _agent_node(func: Callable[..., Any]) -> RunnableCallable:
+    """Wraps a sync agent node so async graph runs call it on the node executor, the loop's default executor if unset."""
+    async def afunc(state: State, **kwargs: Any) -> Any:
+        # The copied context carries the run's config, which interrupt() and the stream writer read
+        call = functools.partial(copy_context().run, func, state, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(_node_executor.get(), call)
+
+    return RunnableCallable(func, afunc, name=func.__name__, trace=False)
+
+class _ChunkForwarder(BaseCallbackHandler):
+    """Passes the chunks of streamed model calls on to a function.
+
+    Has the tap_output methods of langchain's streaming handlers, which makes invoke() stream from the model.
+    """
+
+    def __init__(self, on_chunk: Callable[[AIMessageChunk], None]):
+        self.on_chunk = on_chunk
+
+    def on_llm_new_token(self, token: str, *, chunk: Any = None, **kwargs: Any) -> None:
+        if chunk is not None and isinstance(chunk.message, AIMessageChunk):
+            self.on_chunk(chunk.message)
+
+    def tap_output_iter(self, run_id, output):
+        return output
+
+    def tap_output_aiter(self, run_id, output):
+        return output
+
 class AgentSystem:
     agents: Dict[str, callable]
     links: Dict[str, List[str]]
 
-    def __init__(self):
+    def __init__(self, routing: RoutingMode = "parser", max_route_retries: int = 2, streaming: bool = False,
+                 compaction: Optional[Callable[[List[AnyMessage]], List[AnyMessage]]] = None,
+                 tool_timeout: Optional[float] = 30.0, tool_concurrency: int = 8, capability_index: Optional[CapabilityIndex] = None):
         self.agents = {}
         self.links = {}
+        self.routing = routing
+        self.max_route_retries = max_route_retries
+        # Emit the route result token by token to graph.stream(..., stream_mode="custom")
+        self.streaming = streaming
+        # Optional stage that shrinks the history sent to the model, e.g. compaction.ContextCompactor
+        self.compaction = compaction
+        # Defaults for the tool nodes, tools can override them with the "timeout" and "max_concurrency" metadata keys
+        self.tool_timeout = tool_timeout
+        self.tool_concurrency = tool_concurrency
+        # Routes obvious hand-offs by embedding similarity, built over the agents' capabilities in compile_graph
+        self.capability_index = capability_index
         self._graph = StateGraph(State)
         self._tracer = AppInsightsTracer()
+        # Per agent factories for the prompt | llm runnable, built once in compile_graph
+        self._agent_builders: Dict[str, Callable[[], Runnable]] = {}
+        self._compiled_agents: Dict[str, Runnable] = {}
+        self._prompts: Dict[str, str] = {}
 
     def _add_to_registry(self, agent_name: str, agent: callable = None):
         if agent_name not in self.agents:
@@ -40,12 +136,30 @@ class AgentSystem:
     def _generate_destinations(self, agent_name: str) -> List[str]:
         """Returns the destinations for a given agent."""
         return self.links.get(agent_name, [])
-    
-    def compile_graph(self, initial_agent: str):
+
+    def _describe_agents(self, agent_names: List[str]) -> str:
+        """Returns the routing descriptions of the given agents, one per line."""
+        descriptions = {}
+        for agent in agent_names:
+            if agent in self.agents:
+                descriptions[agent] = self.agents[agent].__doc__
+            elif agent == END:
+                descriptions[agent] = "End of workflow"
+            else:
+                descriptions[agent] = "No description available"
+        return "\n".join([f"{k}: {v}" for k, v in descriptions.items()])
+
+    def compile_graph(self, initial_agent: str, checkpointer: Optional[BaseCheckpointSaver] = None):
+        # The registry is final at this point, so descriptions also cover agents registered after their callers
+        self._compiled_agents = {agent_name: build() for agent_name, build in self._agent_builders.items()}
+        if self.capability_index is not None:
+            capabilities = {agent_name: f"{agent_name}: {agent.__doc__ or self._prompts.get(agent_name, '')}" for agent_name, agent in self.agents.items()}
+            capabilities[END] = f"{END}: End of workflow, the user is done."
+            self.capability_index.build(capabilities)
         self._graph.add_edge(START, initial_agent)
         for agent_name in self.agents:
-            self._graph.add_node(agent_name, self.agents[agent_name], destinations=tuple(self._generate_destinations(agent_name)))
-        return self._graph.compile()
+            self._graph.add_node(agent_name, _agent_node(self.agents[agent_name]), destinations=tuple(self._generate_destinations(agent_name)))
+        return self._graph.compile(checkpointer=checkpointer)
 
     def create_hil_agent(self, agent_name: str, next_agents: List[str]) -> str:
         def _create(state: State, config: RunnableConfig):
@@ -60,6 +174,12 @@ class AgentSystem:
                     raise AssertionError("Expected exactly 1 trigger in human node")
 
                 active_agent = langgraph_triggers[0].split(":")[1]
+                if self.capability_index is not None and isinstance(user_input, str):
+                    # Hand the input straight to the agent that clearly covers it, skipping the active agent's routing turn
+                    target = self.capability_index.select(user_input, next_agents)
+                    if target is not None and target != active_agent:
+                        self.capability_index.count("preselected")
+                        active_agent = target
 
                 return Command(
                     update={
@@ -76,35 +196,33 @@ class AgentSystem:
         self._add_to_registry(agent_name, _create)
         return agent_name
 
-    def create_agent(self, prompt: str, llm: BaseChatModel, agent_name: str, tools: List[callable] = [], next_agents: List[str] = []) -> str:
+    def create_agent(self, prompt: str, llm: BaseChatModel, agent_name: str, tools: List[callable] = [], next_agents: List[str] = [], routing: RoutingMode = None) -> str:
         """Creates an agent."""
         
         tool_node_name = f"{agent_name}_tools"
+        routing = routing or self.routing
+        destinations = tuple(next_agents) or (END,)
+        self._prompts[agent_name] = prompt
         
         class Route(BaseModel):
+            """Returns the response to the user and hands over to the next agent."""
             result: str = Field(..., description="The agent's response")
-            goto: str = Field(..., description="The next agent to call")
+            goto: Literal[destinations] = Field(..., description="The next agent to call")
             capability_description: str = Field(
                 description="A query that can be used to search a vector database for the agent's capabilities",
             )
 
         parser = PydanticOutputParser(pydantic_object=Route)
 
-        def _create_agent_node(state: State):
-
-            #create list of docstring from next_agents
-            next_agent_descriptions = {}
-            for agent in next_agents:
-                if agent in self.agents:
-                    next_agent_descriptions[agent] = self.agents[agent].__doc__
-                elif agent == "__end__":
-                    next_agent_descriptions[agent] = "End of workflow"
-                else:
-                    next_agent_descriptions[agent] = "No description available"
-
-            #convert to string
-            next_agent_descriptions = "\n".join([f"{k}: {v}" for k, v in next_agent_descriptions.items()])
-
+        if routing == "structured":
+            extended_prompt = """
+            -----------------------------
+            Use the folowing information to help you decide which agent to call next. Ignore the info below, if you want to call a tool.:
+            Next agents available: {next_agents}
+            -----------------------------
+            Once you are done, call the Route tool with your response and the next agent.
+            """
+        else:
             extended_prompt = """
             -----------------------------
             Use the folowing information to help you decide which agent to call next. Ignore the info below, if you want to call a tool.:
@@ -113,26 +231,117 @@ class AgentSystem:
             Format instructions: {format_instructions}
             """
 
-            prompt_template = ChatPromptTemplate.from_messages([
-                SystemMessage(f"{prompt}\n\n{extended_prompt}"),
+        def _build() -> Runnable:
+            # Everything that is fixed per agent goes first and the growing conversation last, so consecutive turns
+            # share a byte identical prompt prefix that the provider can serve from its prompt cache
+            instructions = extended_prompt.format(
+                next_agents=", ".join(destinations),
+                format_instructions="" if routing == "structured" else parser.get_format_instructions(),
+            )
+            messages = [
+                SystemMessage(f"{prompt}\n\n{instructions}\n\n{self._describe_agents(next_agents)}"),
                 MessagesPlaceholder("context"),
-                MessagesPlaceholder("next_agents"),
-                MessagesPlaceholder("format_instructions"),
-            ])
+            ]
+            if routing == "structured":
+                # The route is a tool call, goto is constrained by the schema and no format instructions are needed
+                return ChatPromptTemplate.from_messages(messages) | llm.bind_tools(tools + [Route], tool_choice="required")
+            return ChatPromptTemplate.from_messages(messages) | llm.bind_tools(tools, tool_choice="auto")
+
+        def _parse_route(raw_result: AIMessage) -> Route:
+            if routing == "structured":
+                route_calls = [tool_call for tool_call in raw_result.tool_calls if tool_call["name"] == Route.__name__]
+                if not route_calls:
+                    raise OutputParserException("Expected a call to the Route tool.")
+                return Route.model_validate(route_calls[0]["args"])
+            return parser.parse(raw_result.content)
+
+        def _invoke(call: Runnable, context: List[AnyMessage]) -> AIMessage:
+            if not self.streaming:
+                return call.invoke({"context": context})
+
+            writer = _stream_writer()
+            message = None
+            emitted = ""
+
+            def emit(partial: AIMessage):
+                nonlocal emitted
+                result = _partial_route_result(partial, routing, Route.__name__)
+                if result and result.startswith(emitted) and len(result) > len(emitted):
+                    writer({"agent": agent_name, "token": result[len(emitted):]})
+                    emitted = result
+
+            def on_chunk(chunk: AIMessageChunk):
+                nonlocal message
+                message = chunk if message is None else message + chunk
+                emit(message)
+
+            # Invoked instead of streamed, so a response cache on the model answers before any token is requested
+            config = merge_configs(ensure_config(), {"callbacks": [_ChunkForwarder(on_chunk)]})
+            result = call.invoke({"context": context}, config=config)
+            # Cached responses arrive without chunks and are emitted at once
+            emit(result)
+            return result
+
+        def _create_agent_node(state: State):
+            call = self._compiled_agents[agent_name]
 
             with self._tracer.get_tracer().start_as_current_span(agent_name):
-                call = prompt_template | llm.bind_tools(tools, tool_choice="auto")
-                raw_result = call.invoke({"context": state["messages"], "next_agents": [next_agent_descriptions], "format_instructions": [parser.get_format_instructions()]})
+                context = state["messages"]
+                if self.compaction is not None:
+                    context = self.compaction(context)
+                result = None
+                repaired = False
+                for attempt in range(self.max_route_retries + 1):
+                    # A cached response that fails the route would fail the same way on every identical turn
+                    with hold_writes() as cache_writes:
+                        raw_result = _invoke(call, context)
 
-                if raw_result.tool_calls:
-                    return Command(
-                        update={"messages": [raw_result]},
-                        goto=tool_node_name,
-                    )
+                    tool_calls = [tool_call for tool_call in raw_result.tool_calls if tool_call["name"] != Route.__name__]
+                    if tool_calls:
+                        if len(tool_calls) != len(raw_result.tool_calls):
+                            # Tools take precedence, the route is decided once their results are in
+                            raw_result = raw_result.model_copy(update={"tool_calls": tool_calls, "additional_kwargs": {}})
+                        cache_writes.commit()
+                        return Command(
+                            update={"messages": [raw_result]},
+                            goto=tool_node_name,
+                        )
 
-                result = parser.parse(raw_result.content)
+                    try:
+                        result = _parse_route(raw_result)
+                        cache_writes.commit()
+                        break
+                    except (OutputParserException, ValidationError) as e:
+                        logger.warning("%s returned an invalid route (attempt %d): %s", agent_name, attempt + 1, e)
+                        if self.capability_index is not None:
+                            text = _partial_route_result(raw_result, routing, Route.__name__) or raw_result.content
+                            hint = _partial_route_result(raw_result, routing, Route.__name__, "capability_description") or text
+                            goto = self.capability_index.select(hint, destinations) if isinstance(text, str) and text else None
+                            if goto is not None:
+                                # The answer is usable, only the destination was missing, no need to ask the model again
+                                self.capability_index.count("repaired")
+                                result = Route(result=text, goto=goto, capability_description=hint)
+                                repaired = True
+                                break
+                        if self.streaming:
+                            # Tell consumers to discard the tokens streamed for the rejected answer
+                            _stream_writer()({"agent": agent_name, "reset": True})
+                        repair = [AIMessage(raw_result.content)] if raw_result.content else []
+                        context = context + repair + [HumanMessage(
+                            f"Your last answer could not be used: {e}\n"
+                            f"Answer again and pick the next agent from: {', '.join(destinations)}."
+                        )]
 
-                #vector search for the agent's capabilities
+                if result is None:
+                    # Give up on routing and keep the conversation alive with the first destination
+                    result = Route(result=raw_result.content or "", goto=destinations[0], capability_description="")
+                elif not repaired and self.capability_index is not None and self.capability_index.verify and result.capability_description and len(destinations) > 1:
+                    ranking = self.capability_index.rank(result.capability_description, destinations)
+                    if ranking:
+                        agreed = ranking[0][0] == result.goto
+                        self.capability_index.count("agreed" if agreed else "disagreed")
+                        if not agreed:
+                            logger.debug("%s routed to %s, capabilities suggest %s", agent_name, result.goto, ranking[0][0])
 
                 return Command(
                     update={
@@ -147,9 +356,12 @@ class AgentSystem:
                 ) 
         self._add_links(agent_name, next_agents + [tool_node_name] if tools else [])
         self._add_to_registry(agent_name, _create_agent_node)
+        self._agent_builders[agent_name] = _build
 
         if tools:
-            self._graph.add_node(tool_node_name, ToolNode(tools))
+            self._graph.add_node(tool_node_name, ParallelToolNode(
+                tools, tracer=self._tracer.get_tracer(), timeout=self.tool_timeout, max_concurrency=self.tool_concurrency, name=tool_node_name,
+            ))
             self._graph.add_edge(tool_node_name, agent_name)
         
         return agent_name
\ No newline at end of file
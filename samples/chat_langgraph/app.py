@@ -11,27 +11,53 @@ from token_counter import TokenCounterCallback
 from langchain_core.tools import tool
 import uuid
 from agent import AgentSystem
-from llm import get_model_on_azure, get_github_model
+from compaction import ContextCompactor
+from capabilities import CapabilityIndex
+from llm import get_model_on_azure, get_github_model, get_embeddings_on_azure
+from product_search import ProductCatalog
+from sqlite_checkpointer import SQLiteDeltaSaver
+from response_cache import ResponseCache
 
 dotenv.load_dotenv()
 
 callback = TokenCounterCallback()
 
-llm = get_model_on_azure(os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"), temperature=1.0, callbacks=[callback])
+# Opt-in, only worth it for turns that are deterministic given their messages
+response_cache_db = os.getenv("AGENT_RESPONSE_CACHE")
+response_similarity = os.getenv("AGENT_RESPONSE_CACHE_SIMILARITY")
+response_cache = ResponseCache(
+    response_cache_db,
+    ttl_seconds=float(os.getenv("AGENT_RESPONSE_CACHE_TTL_SECONDS", 24 * 3600)),
+    embeddings=get_embeddings_on_azure(os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")) if response_similarity else None,
+    similarity_threshold=float(response_similarity or 0.95),
+) if response_cache_db else None
+
+llm = get_model_on_azure(os.getenv("AZURE_OPENAI_COMPLETION_DEPLOYMENT_NAME"), temperature=1.0, callbacks=[callback], cache=response_cache)
 #llm = get_github_model()
-agents = AgentSystem()
+agents = AgentSystem(
+    routing="structured",
+    streaming=True,
+    compaction=ContextCompactor(max_tokens=6000, summarizer=llm, usage=callback),
+    capability_index=CapabilityIndex(get_embeddings_on_azure(os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME")))
+    if os.getenv("AGENT_CAPABILITY_ROUTING", "false").lower() == "true" else None,
+)
 
 #-----------------------------------------------------------------------------------------------
 
+# Loaded and indexed once, embedding based ranking is optional
+catalog = ProductCatalog.from_file(
+    Path(__file__).parent / "assets/products.json",
+    embeddings=get_embeddings_on_azure(os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"))
+    if os.getenv("PRODUCT_SEARCH_EMBEDDINGS", "false").lower() == "true" else None,
+)
+
 @tool
 def product_search_tool(query: str) -> str:
     """
     A tool that searches for furniture in a product database and returns the results.
     :return: A list of product names and descriptions.
     """
-    with open(Path(__file__).parent / "assets/products.json", "r", encoding="utf-8") as f:
-        products = json.load(f)
-    return products
+    return json.dumps(catalog.search(query, k=5))
 
 @tool
 def order_tool(order_details: str) -> str:
@@ -105,6 +131,11 @@ agents.create_agent(
 
 #-----------------------------------------------------------------------------------------------
 
-graph = agents.compile_graph(initial_agent="product_search_agent")
+# langgraph dev and the platform bring their own checkpointer, a local database is only used when configured
+checkpoint_db = os.getenv("AGENT_CHECKPOINT_DB")
+graph = agents.compile_graph(
+    initial_agent="product_search_agent",
+    checkpointer=SQLiteDeltaSaver(checkpoint_db, ttl_seconds=float(os.getenv("AGENT_CHECKPOINT_TTL_SECONDS", 7 * 24 * 3600))) if checkpoint_db else None,
+)
 graph.name = "Product Search Graph"
 
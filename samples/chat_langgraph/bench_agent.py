@@ -0,0 +1,49 @@
+import json
+import os
+import time
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.tools import tool
+
+os.environ.setdefault("TRACING_EXPORTER", "none")
+
+from agent import AgentSystem
+from fake_llm import FakeChatModel
+
+TURNS = 2000
+
+@tool
+def lookup_tool(query: str) -> str:
+    """A tool that looks up a query."""
+    return query
+
+def build_system(llm: FakeChatModel) -> AgentSystem:
+    agents = AgentSystem()
+    agents.create_hil_agent(agent_name="human_input_agent", next_agents=["first_agent", "second_agent"])
+    agents.create_agent(prompt="You are the first agent.", llm=llm, agent_name="first_agent", tools=[lookup_tool],
+                        next_agents=["human_input_agent", "second_agent", "__end__"])
+    agents.create_agent(prompt="You are the second agent.", llm=llm, agent_name="second_agent", tools=[lookup_tool],
+                        next_agents=["human_input_agent", "first_agent", "__end__"])
+    agents.compile_graph(initial_agent="first_agent")
+    return agents
+
+def measure(label: str, fn, turns: int = TURNS):
+    fn()
+    start = time.perf_counter()
+    for _ in range(turns):
+        fn()
+    elapsed = (time.perf_counter() - start) / turns * 1_000_000
+    print(f"{label:<40}{elapsed:>10.1f} us/turn")
+    return elapsed
+
+if __name__ == "__main__":
+    route = json.dumps({"result": "Here are some tables.", "goto": "human_input_agent", "capability_description": "table search"})
+    llm = FakeChatModel(responses=[AIMessage(content=route)])
+    agents = build_system(llm)
+    state = {"messages": [HumanMessage("I need a table.")]}
+    node = agents.agents["first_agent"]
+    build = agents._agent_builders["first_agent"]
+
+    # Building the runnable is the work that used to happen inside every turn
+    rebuild = measure("prompt + bind_tools construction", build)
+    turn = measure("agent turn, precompiled", lambda: node(state))
+    print(f"{'agent turn, rebuilt per turn (estimated)':<40}{turn + rebuild:>10.1f} us/turn")
@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from product_search import ProductCatalog
+
+ADJECTIVES = ["modern", "rustic", "compact", "ergonomic", "vintage", "minimalist", "luxury", "foldable", "outdoor", "classic"]
+MATERIALS = ["oak", "walnut", "glass", "leather", "steel", "bamboo", "velvet", "marble", "rattan", "pine"]
+TYPES = ["sofa", "chair", "table", "bed frame", "bookshelf", "desk", "wardrobe", "lamp", "rug", "cabinet", "stool", "mirror"]
+QUERIES = ["leather sofa", "oak dining table", "ergonomic office chair", "outdoor rattan chair", "glass coffee table", "bamboo bookshelf"]
+
+def synthetic_catalog(size: int, seed: int = 42) -> list[dict]:
+    rng = random.Random(seed)
+    products = []
+    for i in range(size):
+        adjective, material, kind = rng.choice(ADJECTIVES), rng.choice(MATERIALS), rng.choice(TYPES)
+        products.append({
+            "id": i + 1,
+            "name": f"{adjective.title()} {material.title()} {kind.title()}",
+            "description": f"A {adjective} {kind} made of {material}, {rng.choice(['seats four', 'easy to assemble', 'with storage', 'stain resistant', 'handmade'])}.",
+            "price": round(rng.uniform(20, 2000), 2),
+        })
+    return products
+
+def approximate_tokens(text: str) -> int:
+    return len(text) // 4
+
+def measure(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(QUERIES[i % len(QUERIES)])
+    return (time.perf_counter() - start) / repeat * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the indexed product search with returning the full catalog.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[30, 1000, 10000])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'products':>9} {'full load ms':>13} {'full tokens':>12} {'bm25 ms':>8} {'hybrid ms':>10} {'top-k tokens':>13} {'index s':>8}")
+    for size in args.sizes:
+        products = synthetic_catalog(size)
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False, encoding="utf-8") as f:
+            json.dump(products, f)
+            path = f.name
+        try:
+            def full_load(query: str) -> str:
+                with open(path, "r", encoding="utf-8") as f:
+                    return json.dumps(json.load(f))
+
+            start = time.perf_counter()
+            lexical = ProductCatalog.from_file(path)
+            index_seconds = time.perf_counter() - start
+            hybrid = ProductCatalog.from_file(path, embeddings=DeterministicFakeEmbedding(size=256))
+
+            full_ms = measure(full_load, args.repeat)
+            lexical_ms = measure(lambda query: json.dumps(lexical.search(query, args.k)), args.repeat)
+            hybrid_ms = measure(lambda query: json.dumps(hybrid.search(query, args.k)), args.repeat)
+            full_tokens = approximate_tokens(full_load(""))
+            topk_tokens = approximate_tokens(json.dumps(lexical.search(QUERIES[0], args.k)))
+            print(f"{size:>9} {full_ms:>13.2f} {full_tokens:>12} {lexical_ms:>8.2f} {hybrid_ms:>10.2f} {topk_tokens:>13} {index_seconds:>8.2f}")
+        finally:
+            os.remove(path)
@@ -0,0 +1,54 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CONFIGS = {
+    "tracing off": {"TRACING_EXPORTER": "none"},
+    "memory exporter, all traces": {"TRACING_EXPORTER": "memory"},
+    "memory exporter, agent spans only": {"TRACING_EXPORTER": "memory", "TRACING_INSTRUMENT_LANGCHAIN": "false"},
+    "memory exporter, 10% head sampled": {"TRACING_EXPORTER": "memory", "TRACING_SAMPLE_RATIO": "0.1"},
+    "memory exporter, tail sampled >1s": {"TRACING_EXPORTER": "memory", "TRACING_TAIL_MIN_DURATION_MS": "1000"},
+}
+
+def run_turns(turns: int):
+    from langchain_core.messages import AIMessage, HumanMessage
+    from bench_agent import build_system
+    from fake_llm import FakeChatModel
+    from tracer import AppInsightsTracer
+    import time
+
+    route = json.dumps({"result": "Here are some tables.", "goto": "human_input_agent", "capability_description": "table search"})
+    agents = build_system(FakeChatModel(responses=[AIMessage(content=route)]))
+    node = agents.agents["first_agent"]
+    state = {"messages": [HumanMessage("I need a table.")]}
+    node(state)
+    start = time.perf_counter()
+    for _ in range(turns):
+        node(state)
+    elapsed = (time.perf_counter() - start) / turns * 1_000_000
+    exporter = AppInsightsTracer().memory_exporter
+    print(json.dumps({"us_per_turn": elapsed, "exported": len(exporter.get_finished_spans()) if exporter else 0}))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the tracing overhead per agent turn.")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_turns(args.turns)
+        sys.exit()
+
+    # The tracer is process wide, so every configuration runs in a process of its own
+    baseline = None
+    for label, env in CONFIGS.items():
+        child_env = {k: v for k, v in os.environ.items() if not k.startswith("TRACING_")}
+        output = subprocess.run(
+            [sys.executable, __file__, "--child", "--turns", str(args.turns)],
+            env={**child_env, **env}, capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        baseline = baseline or result["us_per_turn"]
+        print(f"{label:<40}{result['us_per_turn']:>10.1f} us/turn {result['us_per_turn'] - baseline:>+9.1f} us {result['exported']:>8} spans exported")
@@ -0,0 +1,76 @@
+import threading
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+@dataclass
+class RoutingStats:
+    # Human input handed straight to a matching agent instead of through the active agent. The active agent might
+    # have answered the input itself, so these are not counted as avoided model calls
+    preselected: int = 0
+    # Invalid routes resolved by similarity instead of asking the model again
+    repaired: int = 0
+    # Model routes whose capability description matched the chosen agent best, or another agent
+    agreed: int = 0
+    disagreed: int = 0
+    # Embedding requests of queries, the cost of preselection, repairs and verification
+    embedding_calls: int = 0
+
+    @property
+    def avoided_llm_calls(self) -> int:
+        """Model calls that were certainly not needed, every repair saves the retry of the turn."""
+        return self.repaired
+
+    def to_dict(self) -> Dict[str, int]:
+        return {**asdict(self), "avoided_llm_calls": self.avoided_llm_calls}
+
+class CapabilityIndex:
+    """Embedding index over the capabilities of the agents in a graph.
+
+    A query picks an agent only if it is similar enough to the agent's capabilities and clearly ahead of the
+    other candidates, everything else is left to the model.
+    """
+
+    def __init__(self, embeddings: Embeddings, min_score: float = 0.75, min_margin: float = 0.05, verify: bool = True):
+        self.embeddings = embeddings
+        self.min_score = min_score
+        self.min_margin = min_margin
+        # Compare every model route with the best matching capability. Only counts agreement, so it adds one embedding
+        # request per routed turn without saving a model call, turn it off where the statistics are not needed
+        self.verify = verify
+        self.stats = RoutingStats()
+        self._names: List[str] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def build(self, capabilities: Dict[str, str]):
+        self._names = list(capabilities)
+        matrix = np.asarray(self.embeddings.embed_documents([capabilities[name] for name in self._names]), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._vectors = matrix / np.where(norms == 0, 1, norms)
+
+    def rank(self, query: str, candidates: Sequence[str]) -> List[Tuple[str, float]]:
+        if self._vectors is None or not query.strip():
+            return []
+        rows = [i for i, name in enumerate(self._names) if name in candidates]
+        if not rows:
+            return []
+        self.count("embedding_calls")
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) or 1
+        scores = self._vectors[rows] @ query_vector
+        return sorted(((self._names[i], float(score)) for i, score in zip(rows, scores)), key=lambda entry: -entry[1])
+
+    def select(self, query: str, candidates: Sequence[str]) -> Optional[str]:
+        """Returns the candidate that clearly matches the query, or None if the choice is not obvious."""
+        ranking = self.rank(query, candidates)
+        if not ranking or ranking[0][1] < self.min_score:
+            return None
+        if len(ranking) > 1 and ranking[0][1] - ranking[1][1] < self.min_margin:
+            return None
+        return ranking[0][0]
+
+    def count(self, stat: str):
+        with self._lock:
+            setattr(self.stats, stat, getattr(self.stats, stat) + 1)
@@ -0,0 +1,134 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AnyMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+SUMMARY_PROMPT = """Summarize the following conversation between a user and a team of agents.
+Keep every fact a later agent may need: the user's requests, decisions, selected products, quantities, prices and order details.
+Answer with the summary only."""
+
+def approximate_tokens(message: BaseMessage) -> int:
+    """Cheap token estimate of roughly four characters per token, plus the per message overhead."""
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    size = len(content)
+    if isinstance(message, AIMessage) and message.tool_calls:
+        size += sum(len(json.dumps(tool_call["args"])) for tool_call in message.tool_calls)
+    return size // 4 + 4
+
+class ContextCompactor:
+    """Shrinks the message history that is sent to the model on every agent hop.
+
+    Runs three stages: tool results that an agent already answered are truncated, the history is windowed to a
+    token budget starting at a human message, and the turns that fall out of the window are optionally replaced
+    by a summary. The graph state itself is left untouched.
+
+    The window start moves in steps of window_step tokens instead of with every new message, so the compacted
+    history keeps the same prefix for several turns and stays servable from the provider's prompt cache.
+    """
+
+    def __init__(self, max_tokens: int = 4000, stale_tool_chars: int = 400, summarizer: Optional[BaseChatModel] = None,
+                 token_counter: Callable[[BaseMessage], int] = approximate_tokens, usage=None, max_summaries: int = 256,
+                 window_step: Optional[int] = None):
+        self.max_tokens = max_tokens
+        self.window_step = window_step or max_tokens // 2
+        self.stale_tool_chars = stale_tool_chars
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+        # TokenCounterCallback that gets the saved tokens reported
+        self.usage = usage
+        self.max_summaries = max_summaries
+        self._summaries: OrderedDict[str, tuple[int, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, messages: List[AnyMessage]) -> List[AnyMessage]:
+        before = sum(self.token_counter(message) for message in messages)
+        compacted = self._elide_stale_tool_results(messages)
+        if sum(self.token_counter(message) for message in compacted) > self.max_tokens:
+            start = self._window_start(compacted)
+            if start > 0:
+                dropped, compacted = compacted[:start], compacted[start:]
+                if self.summarizer is not None:
+                    compacted = [SystemMessage(f"Summary of the earlier conversation:\n{self._summarize(dropped)}")] + compacted
+        after = sum(self.token_counter(message) for message in compacted)
+        if self.usage is not None and after < before:
+            self.usage.on_context_compacted(before, after)
+        return compacted
+
+    def _elide_stale_tool_results(self, messages: List[AnyMessage]) -> List[AnyMessage]:
+        # Tool results before the last AI answer without tool calls have been consumed already
+        last_answer = max((i for i, message in enumerate(messages) if isinstance(message, AIMessage) and not message.tool_calls), default=-1)
+        compacted = []
+        for i, message in enumerate(messages):
+            if i < last_answer and isinstance(message, ToolMessage) and isinstance(message.content, str) and len(message.content) > self.stale_tool_chars:
+                elided = len(message.content) - self.stale_tool_chars
+                message = message.model_copy(update={"content": f"{message.content[:self.stale_tool_chars]}... [{elided} characters elided]"})
+            compacted.append(message)
+        return compacted
+
+    def _window_start(self, messages: List[AnyMessage]) -> int:
+        """Returns the index of the oldest message to keep, always a human message so no tool exchange is split."""
+        tokens = [self.token_counter(message) for message in messages]
+        # Candidates are the first human messages after every window_step tokens. They only depend on the messages
+        # before them, so the chosen start stays put while the conversation grows until the window is full again
+        remaining = sum(tokens)
+        consumed = 0
+        next_boundary = 0
+        for i, message in enumerate(messages):
+            if isinstance(message, HumanMessage) and consumed >= next_boundary:
+                if remaining <= self.max_tokens:
+                    return i
+                next_boundary = (consumed // self.window_step + 1) * self.window_step
+            consumed += tokens[i]
+            remaining -= tokens[i]
+        return self._latest_window_start(messages)
+
+    def _latest_window_start(self, messages: List[AnyMessage]) -> int:
+        budget = self.max_tokens
+        start = len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            budget -= self.token_counter(messages[i])
+            if budget < 0:
+                break
+            start = i
+        humans = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        later = [i for i in humans if i >= start]
+        if later:
+            return later[0]
+        earlier = [i for i in humans if i < start]
+        # Over budget rather than starting mid exchange
+        return earlier[-1] if earlier else 0
+
+    def _summarize(self, dropped: List[AnyMessage]) -> str:
+        key = dropped[-1].id or str(len(dropped))
+        with self._lock:
+            if key in self._summaries:
+                self._summaries.move_to_end(key)
+                return self._summaries[key][1]
+            # Extend the longest summary of a prefix of these messages instead of starting over
+            positions = {message.id: i for i, message in enumerate(dropped) if message.id}
+            previous = max(((positions[k], summary) for k, (_, summary) in self._summaries.items() if k in positions), default=None)
+
+        if previous is not None:
+            index, summary = previous
+            transcript = f"Summary so far:\n{summary}\n\n" + self._render(dropped[index + 1:])
+        else:
+            transcript = self._render(dropped)
+        summary = self.summarizer.invoke([SystemMessage(SUMMARY_PROMPT), HumanMessage(transcript)]).content
+
+        with self._lock:
+            self._summaries[key] = (len(dropped), summary)
+            while len(self._summaries) > self.max_summaries:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _render(self, messages: List[AnyMessage]) -> str:
+        lines = []
+        for message in messages:
+            content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+            if isinstance(message, ToolMessage):
+                content = content[:self.stale_tool_chars]
+            if content:
+                lines.append(f"{message.type}: {content}")
+        return "\n".join(lines)
@@ -0,0 +1,50 @@
+import json
+from typing import Any, Iterator, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that cycles through canned responses, for benchmarks and offline runs without a deployment."""
+
+    responses: List[AIMessage]
+    index: int = 0
+    # Number of characters per streamed chunk
+    chunk_size: int = 4
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _next_response(self) -> AIMessage:
+        response = self.responses[self.index % len(self.responses)]
+        self.index += 1
+        return response.model_copy()
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=self._next_response())])
+
+    def bind_tools(self, tools: List[Any], **kwargs: Any):
+        return self.bind(tools=tools, **kwargs)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        response = self._next_response()
+        content = response.content if isinstance(response.content, str) else json.dumps(response.content)
+        for i in range(0, len(content), self.chunk_size):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=content[i:i + self.chunk_size]))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+        for index, tool_call in enumerate(response.tool_calls):
+            args = json.dumps(tool_call["args"])
+            for i in range(0, len(args), self.chunk_size):
+                first = i == 0
+                yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[{
+                    "name": tool_call["name"] if first else None,
+                    "args": args[i:i + self.chunk_size],
+                    "id": tool_call["id"] if first else None,
+                    "index": index,
+                }]))
+        if response.usage_metadata:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=response.usage_metadata))
@@ -1,10 +1,17 @@
+import functools
 import os
-from typing import List
+from typing import List, Optional
+from langchain_core.caches import BaseCache
 from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from langchain.chat_models import init_chat_model
 
-def get_model_on_azure(deployment_name: str, temperature: float = 0.0, callbacks: List = None):
+# One credential and token cache per process instead of one per model
+@functools.cache
+def _get_token_provider():
+    return get_bearer_token_provider(DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default")
+
+def get_model_on_azure(deployment_name: str, temperature: float = 0.0, callbacks: List = None, cache: Optional[BaseCache] = None):
     
     #If you stick to the default environment variables, you can remove the model_kwargs.
     
@@ -18,11 +25,27 @@ def get_model_on_azure(deployment_name: str, temperature: float = 0.0, callbacks
     if api_key:
         model_kwargs["api_key"] = api_key
     else:
-        model_kwargs["azure_ad_token_provider"] = get_bearer_token_provider(
-            DefaultAzureCredential(), "https://cognitiveservices.azure.com/.default"
-        )
+        model_kwargs["azure_ad_token_provider"] = _get_token_provider()
+
+    # stream_usage keeps usage_metadata available when agents stream their responses
+    # A cache answers repeated requests with the same deployment, temperature, tools and messages without a model call
+    return init_chat_model(deployment_name, model_provider="azure_openai", temperature=temperature, stream_usage=True, cache=cache,
+                           model_kwargs=model_kwargs)
+
+def get_embeddings_on_azure(deployment_name: str):
+    kwargs = {
+        "azure_deployment": deployment_name,
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION"),
+        "azure_endpoint": os.getenv("AZURE_OPENAI_ENDPOINT"),
+    }
+
+    api_key = os.getenv("AZURE_OPENAI_API_KEY")
+    if api_key:
+        kwargs["api_key"] = api_key
+    else:
+        kwargs["azure_ad_token_provider"] = _get_token_provider()
 
-    return init_chat_model(deployment_name, model_provider="azure_openai", temperature=temperature, model_kwargs=model_kwargs)
+    return AzureOpenAIEmbeddings(**kwargs)
 
 def get_github_model():
     model_kwargs = {
@@ -0,0 +1,113 @@
+import json
+import math
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower()) if text else []
+
+class ProductCatalog:
+    """Product catalog that is loaded and indexed once and answers queries with the top-k matching products.
+
+    Ranks with BM25 over the name and description. If an embeddings model is given, products are also ranked by
+    cosine similarity and both rankings are fused with reciprocal rank fusion.
+    """
+
+    search_fields: Sequence[str] = ("name", "description")
+    field_weights: Dict[str, float] = {"name": 2.0, "description": 1.0}
+    k1: float = 1.2
+    b: float = 0.75
+    rrf_k: int = 60
+
+    def __init__(self, products: List[Dict[str, Any]], result_fields: Sequence[str] = ("name", "description", "price"),
+                 embeddings: Optional[Embeddings] = None, embedding_batch_size: int = 256):
+        self.products = products
+        self.result_fields = result_fields
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._lengths: List[float] = []
+        self._idf: Dict[str, float] = {}
+        self._build_lexical_index()
+
+        self.embeddings = embeddings
+        self._vectors: Optional[np.ndarray] = None
+        if embeddings is not None:
+            self._build_vector_index(embedding_batch_size)
+
+    @classmethod
+    def from_file(cls, path: Path, **kwargs) -> "ProductCatalog":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def _text(self, product: Dict[str, Any]) -> str:
+        return " ".join(str(product.get(field, "")) for field in self.search_fields)
+
+    def _build_lexical_index(self):
+        for doc_id, product in enumerate(self.products):
+            frequencies: Dict[str, float] = defaultdict(float)
+            length = 0.0
+            for field in self.search_fields:
+                weight = self.field_weights.get(field, 1.0)
+                for token in tokenize(str(product.get(field, ""))):
+                    frequencies[token] += weight
+                    length += weight
+            self._lengths.append(length)
+            for token, frequency in frequencies.items():
+                self._postings[token][doc_id] = frequency
+
+        count = len(self.products)
+        self._avg_length = sum(self._lengths) / count if count else 0.0
+        for token, postings in self._postings.items():
+            df = len(postings)
+            self._idf[token] = math.log(1 + (count - df + 0.5) / (df + 0.5))
+
+    def _build_vector_index(self, batch_size: int):
+        texts = [self._text(product) for product in self.products]
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            vectors.extend(self.embeddings.embed_documents(texts[i:i + batch_size]))
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._vectors = matrix / np.where(norms == 0, 1, norms)
+
+    def _lexical_ranking(self, query: str, limit: int) -> List[int]:
+        scores: Dict[int, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = self._idf[token]
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / self._avg_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return [doc_id for doc_id, _ in sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))[:limit]]
+
+    def _vector_ranking(self, query: str, limit: int) -> List[int]:
+        query_vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) or 1
+        scores = self._vectors @ query_vector
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        return [int(i) for i in top[np.argsort(-scores[top])]]
+
+    def search_ids(self, query: str, k: int = 5) -> List[int]:
+        candidates = max(k * 4, 20)
+        rankings = [self._lexical_ranking(query, candidates)]
+        if self._vectors is not None and len(self.products) > 0 and query.strip():
+            rankings.append(self._vector_ranking(query, candidates))
+
+        fused: Dict[int, float] = defaultdict(float)
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking):
+                fused[doc_id] += 1 / (self.rrf_k + rank + 1)
+        ids = [doc_id for doc_id, _ in sorted(fused.items(), key=lambda entry: (-entry[1], entry[0]))[:k]]
+        # Nothing matched, offer a few products instead of an empty answer
+        return ids or list(range(min(k, len(self.products))))
+
+    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        return [{field: self.products[i].get(field) for field in self.result_fields} for i in self.search_ids(query, k)]
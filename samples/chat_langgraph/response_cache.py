@@ -0,0 +1,201 @@
+import contextlib
+import functools
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    generations TEXT NOT NULL,
+    vector BLOB,
+    latency REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope, created_at);
+"""
+
+# Differ between runs of the same conversation and are left out of the key
+_VOLATILE_FIELDS = ("id", "response_metadata", "usage_metadata")
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    # Hits found by the similarity of the last message instead of the exact key
+    similar_hits: int = 0
+    misses: int = 0
+    # Latency of the original model calls that hits answered instead
+    saved_seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**asdict(self), "saved_seconds": round(self.saved_seconds, 3), "hit_rate": self.hit_rate}
+
+@dataclass
+class HeldWrites:
+    """Cache writes of the responses within hold_writes, stored once the caller accepted the response."""
+    writes: List[Callable[[], None]] = field(default_factory=list)
+
+    def commit(self):
+        for write in self.writes:
+            write()
+        self.writes.clear()
+
+_held_writes: ContextVar[Optional[HeldWrites]] = ContextVar("held_cache_writes", default=None)
+
+@contextlib.contextmanager
+def hold_writes() -> Iterator[HeldWrites]:
+    """Holds back the ResponseCache writes of the model calls within, they are dropped unless commit() is called."""
+    held = HeldWrites()
+    token = _held_writes.set(held)
+    try:
+        yield held
+    finally:
+        _held_writes.reset(token)
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _keys(prompt: str, llm_string: str) -> Tuple[str, str, Optional[str]]:
+    """Returns the exact key, the scope of all messages but the last human message and the text of that message."""
+    messages = json.loads(prompt)
+    query = None
+    for i, message in enumerate(messages):
+        kwargs = message.get("kwargs", {})
+        for field in _VOLATILE_FIELDS:
+            kwargs.pop(field, None)
+        if message.get("id", [""])[-1] == "HumanMessage" and isinstance(kwargs.get("content"), str) and kwargs["content"].strip():
+            query = i
+    if query is None:
+        return _hash([llm_string, messages]), "", None
+    scope = _hash([llm_string, messages[:query], messages[query + 1:]])
+    return _hash([llm_string, messages]), scope, messages[query]["kwargs"]["content"]
+
+def _dump_generations(generations: RETURN_VAL_TYPE) -> str:
+    return json.dumps([{"message": message_to_dict(generation.message), "generation_info": generation.generation_info}
+                       for generation in generations if isinstance(generation, ChatGeneration)])
+
+class ResponseCache(BaseCache):
+    """LLM response cache in a local SQLite database, set as cache of a chat model.
+
+    Responses are found by an exact key over the model settings, which include the deployment, the temperature and
+    the bound tools, and the messages without their ids and metadata. With embeddings, a miss falls back to the entry
+    with the same settings and preceding messages whose last message is most similar, if the cosine similarity is at
+    least similarity_threshold. Entries expire ttl_seconds after they were written. Responses of model calls within
+    hold_writes are only stored if the caller commits them, e.g. once the answer was accepted.
+    """
+
+    def __init__(self, path: str = "responses.sqlite", ttl_seconds: float = 24 * 3600, embeddings: Optional[Embeddings] = None,
+                 similarity_threshold: float = 0.95):
+        self.ttl_seconds = ttl_seconds
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.stats = CacheStats()
+        # Lookup time and last message vector of the misses, update() stores them with the response
+        self._pending: Dict[str, Tuple[float, Optional[np.ndarray]]] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _embed(self, text: Optional[str]) -> Optional[np.ndarray]:
+        if self.embeddings is None or text is None:
+            return None
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1)
+
+    def _find_similar(self, scope: str, vector: np.ndarray, cutoff: float) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT generations, vector, latency FROM responses WHERE scope = ? AND created_at >= ? AND vector IS NOT NULL",
+                (scope, cutoff),
+            ).fetchall()
+        if not rows:
+            return None
+        scores = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        return rows[best][0], rows[best][2]
+
+    def _hit(self, generations: str, latency: float, similar: bool) -> List[ChatGeneration]:
+        with self._lock:
+            self.stats.hits += 1
+            self.stats.similar_hits += similar
+            self.stats.saved_seconds += latency
+        result = []
+        for generation in json.loads(generations):
+            message = messages_from_dict([generation["message"]])[0]
+            if isinstance(message, AIMessage):
+                # No tokens were spent on a hit, usage callbacks must not count them again
+                message = message.model_copy(update={"usage_metadata": None, "response_metadata": {**message.response_metadata, "cache_hit": True}})
+            result.append(ChatGeneration(message=message, generation_info=generation["generation_info"]))
+        return result
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key, scope, last = _keys(prompt, llm_string)
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT generations, latency FROM responses WHERE key = ? AND created_at >= ?", (key, cutoff)
+            ).fetchone()
+        if row is not None:
+            return self._hit(row[0], row[1], similar=False)
+
+        vector = self._embed(last)
+        if vector is not None:
+            similar = self._find_similar(scope, vector, cutoff)
+            if similar is not None:
+                return self._hit(similar[0], similar[1], similar=True)
+        with self._lock:
+            self.stats.misses += 1
+            self._pending[key] = (time.perf_counter(), vector)
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key, scope, _ = _keys(prompt, llm_string)
+        with self._lock:
+            started, vector = self._pending.pop(key, (None, None))
+        latency = time.perf_counter() - started if started is not None else 0.0
+        write = functools.partial(self._write, key, scope, _dump_generations(return_val), vector, latency)
+        held = _held_writes.get()
+        if held is not None:
+            held.writes.append(write)
+        else:
+            write()
+
+    def _write(self, key: str, scope: str, generations: str, vector: Optional[np.ndarray], latency: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, scope, generations, vector, latency, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, scope, generations, vector.tobytes() if vector is not None else None, latency, time.time()),
+            )
+
+    def cleanup(self) -> int:
+        """Removes the expired entries and returns how many were removed."""
+        with self._lock:
+            return self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)).rowcount
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._pending.clear()
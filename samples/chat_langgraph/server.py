@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+from aiohttp import WSMsgType, web
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import Command
+from agent import node_executor
+
+logger = logging.getLogger(__name__)
+
+# Events end with exactly one of these
+_TERMINAL_EVENTS = ("done", "error")
+
+class ServerBusy(Exception):
+    """Raised when a turn cannot be queued, either for its thread or for the whole server."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@dataclass
+class Turn:
+    thread_id: str
+    text: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+    events: asyncio.Queue = field(default_factory=asyncio.Queue)
+
+    def emit(self, event: Dict[str, Any]):
+        self.events.put_nowait(event)
+
+    async def stream(self):
+        """Yields the events of the turn until it is done or failed."""
+        while True:
+            event = await self.events.get()
+            yield event
+            if event["type"] in _TERMINAL_EVENTS:
+                return
+
+def _message_events(node: str, update: Any) -> List[Dict[str, Any]]:
+    """Returns the answers to the user in a node's state update, tool calls and tool results are internal."""
+    events = []
+    messages = update.get("messages", []) if isinstance(update, dict) else []
+    for message in messages if isinstance(messages, list) else [messages]:
+        if isinstance(message, dict) and message.get("role") == "ai" and message.get("content"):
+            events.append({"type": "message", "agent": node, "content": message["content"]})
+        elif isinstance(message, AIMessage) and message.content and not message.tool_calls:
+            events.append({"type": "message", "agent": node, "content": message.content})
+    return events
+
+class TurnScheduler:
+    """Runs the turns of many conversation threads on one compiled graph.
+
+    Turns of a thread run one at a time in arrival order, so a thread's checkpoints are never written by two turns at
+    once. Threads with waiting turns are served round robin by max_concurrency workers, so a thread with many queued
+    turns does not hold up the others. Input for an interrupted thread resumes the interrupt, any other input starts
+    a new run of the graph on the thread's history.
+    """
+
+    def __init__(self, graph: CompiledStateGraph, max_concurrency: int = 8, max_pending_per_thread: int = 4,
+                 max_pending: int = 1000, turn_timeout: Optional[float] = 300.0, window: int = 1000):
+        if graph.checkpointer is None:
+            raise ValueError("The graph needs a checkpointer to keep the state of its threads between turns.")
+        self.graph = graph
+        self.max_concurrency = max_concurrency
+        self.max_pending_per_thread = max_pending_per_thread
+        self.max_pending = max_pending
+        self.turn_timeout = turn_timeout
+        self.completed = 0
+        self.failed = 0
+        self.interrupted = 0
+        self._pending: Dict[str, Deque[Turn]] = {}
+        # Threads with waiting turns that are not running, in the order they are served
+        self._ready: OrderedDict[str, None] = OrderedDict()
+        self._running: set[str] = set()
+        self._wakeup = asyncio.Condition()
+        self._workers: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue_wait: Deque[float] = deque(maxlen=window)
+        self._turn_duration: Deque[float] = deque(maxlen=window)
+        self._accepting = False
+
+    @property
+    def queued(self) -> int:
+        return sum(len(turns) for turns in self._pending.values())
+
+    async def start(self):
+        # Agent nodes are synchronous, they get their own executor sized so it does not limit the workers
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency * 2, thread_name_prefix="graph")
+        self._accepting = True
+        self._workers = [asyncio.create_task(self._worker(), name=f"turn-worker-{i}") for i in range(self.max_concurrency)]
+
+    async def stop(self, drain_timeout: float = 30.0):
+        """Stops accepting turns and waits for the queued and running turns before stopping the workers."""
+        self._accepting = False
+        deadline = time.monotonic() + drain_timeout
+        while (self.queued or self._running) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def submit(self, thread_id: str, text: str) -> Turn:
+        if not self._accepting:
+            raise ServerBusy("The server is shutting down.", retry_after=5.0)
+        # Checked before the thread gets a queue, rejected turns must not leave empty queues behind
+        if self.queued >= self.max_pending:
+            raise ServerBusy("Too many turns waiting.")
+        waiting = len(self._pending.get(thread_id, ()))
+        if waiting >= self.max_pending_per_thread:
+            raise ServerBusy(f"Thread {thread_id} has {waiting} turns waiting.")
+        turn = Turn(thread_id, text)
+        self._pending.setdefault(thread_id, deque()).append(turn)
+        if thread_id not in self._running:
+            self._ready[thread_id] = None
+        asyncio.get_running_loop().create_task(self._notify())
+        return turn
+
+    async def _notify(self):
+        async with self._wakeup:
+            self._wakeup.notify()
+
+    async def _next_turn(self) -> Turn:
+        async with self._wakeup:
+            await self._wakeup.wait_for(lambda: bool(self._ready))
+            thread_id, _ = self._ready.popitem(last=False)
+            self._running.add(thread_id)
+            return self._pending[thread_id].popleft()
+
+    def _finish(self, thread_id: str):
+        self._running.discard(thread_id)
+        if self._pending.get(thread_id):
+            # Back to the end of the line, the other waiting threads go first
+            self._ready[thread_id] = None
+        else:
+            self._pending.pop(thread_id, None)
+
+    async def _worker(self):
+        with node_executor(self._executor):
+            while True:
+                turn = await self._next_turn()
+                try:
+                    await self._run(turn)
+                finally:
+                    self._finish(turn.thread_id)
+                    await self._notify()
+
+    async def _run(self, turn: Turn):
+        started = time.monotonic()
+        self._queue_wait.append(started - turn.enqueued_at)
+        try:
+            if self.turn_timeout is None:
+                interrupted = await self._stream(turn)
+            else:
+                interrupted = await asyncio.wait_for(self._stream(turn), self.turn_timeout)
+        except asyncio.CancelledError:
+            turn.emit({"type": "error", "error": "The server stopped before the turn completed."})
+            raise
+        except Exception as e:
+            # The thread stays at its last checkpoint and the next turn continues from there
+            logger.exception("Turn of thread %s failed", turn.thread_id)
+            self.failed += 1
+            turn.emit({"type": "error", "error": "Timed out." if isinstance(e, asyncio.TimeoutError) else str(e)})
+            return
+        self.completed += 1
+        self.interrupted += interrupted
+        self._turn_duration.append(time.monotonic() - started)
+        turn.emit({"type": "done", "interrupted": interrupted})
+
+    async def _stream(self, turn: Turn) -> bool:
+        config = {"configurable": {"thread_id": turn.thread_id}}
+        state = await self.graph.aget_state(config)
+        if any(task.interrupts for task in state.tasks):
+            graph_input = Command(resume=turn.text)
+        else:
+            graph_input = {"messages": [HumanMessage(turn.text)]}
+
+        interrupted = False
+        async for mode, chunk in self.graph.astream(graph_input, config, stream_mode=["custom", "updates"]):
+            if mode == "custom":
+                turn.emit({"type": "token", **chunk})
+                continue
+            for node, update in chunk.items():
+                if node == "__interrupt__":
+                    interrupted = True
+                    for item in update:
+                        turn.emit({"type": "interrupt", "value": item.value})
+                else:
+                    for event in _message_events(node, update):
+                        turn.emit(event)
+        return interrupted
+
+    async def thread_state(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        state = await self.graph.aget_state({"configurable": {"thread_id": thread_id}})
+        if not state.values:
+            return None
+        messages: List[BaseMessage] = state.values.get("messages", [])
+        return {
+            "thread_id": thread_id,
+            "messages": [{"type": message.type, "content": message.content} for message in messages
+                         if message.type in ("human", "ai") and message.content],
+            "interrupted": any(task.interrupts for task in state.tasks),
+            "next": list(state.next),
+            "queued": len(self._pending.get(thread_id, ())),
+            "running": thread_id in self._running,
+        }
+
+    async def delete_thread(self, thread_id: str) -> bool:
+        if thread_id in self._running or self._pending.get(thread_id):
+            raise ServerBusy(f"Thread {thread_id} has turns running or waiting.")
+        checkpointer = self.graph.checkpointer
+        if hasattr(checkpointer, "adelete_thread"):
+            await checkpointer.adelete_thread(thread_id)
+            return True
+        if hasattr(checkpointer, "delete_thread"):
+            await asyncio.get_running_loop().run_in_executor(self._executor, checkpointer.delete_thread, thread_id)
+            return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        def percentile(values: Deque[float], p: float) -> Optional[float]:
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 4) if ordered else None
+
+        return {
+            "running": len(self._running),
+            "queued": self.queued,
+            "threads_waiting": len(self._ready),
+            "completed": self.completed,
+            "failed": self.failed,
+            "interrupted": self.interrupted,
+            "queue_wait": {f"p{p}": percentile(self._queue_wait, p) for p in (50, 95)},
+            "turn_duration": {f"p{p}": percentile(self._turn_duration, p) for p in (50, 95)},
+        }
+
+def _busy_response(e: ServerBusy) -> web.Response:
+    return web.json_response({"error": str(e)}, status=429, headers={"retry-after": str(max(1, round(e.retry_after)))})
+
+def _bad_request(message: str) -> web.HTTPBadRequest:
+    return web.HTTPBadRequest(text=json.dumps({"error": message}), content_type="application/json")
+
+def create_app(scheduler: TurnScheduler) -> web.Application:
+    """HTTP and websocket API over the scheduler.
+
+    POST /threads                      creates a thread id
+    POST /threads/{thread_id}/turns    runs a turn with {"message": ...} and returns its events
+    GET  /threads/{thread_id}/ws       websocket, every text message is a turn, events are sent as they happen
+    GET  /threads/{thread_id}          returns the conversation and whether it waits for user input
+    DELETE /threads/{thread_id}        removes the thread from the checkpointer
+    GET  /stats                        scheduler statistics
+    """
+    routes = web.RouteTableDef()
+
+    @routes.post("/threads")
+    async def create_thread(request: web.Request) -> web.Response:
+        return web.json_response({"thread_id": str(uuid.uuid4())}, status=201)
+
+    @routes.post("/threads/{thread_id}/turns")
+    async def run_turn(request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+        except ValueError:
+            raise _bad_request("The body is not valid JSON.")
+        if not isinstance(body, dict) or not isinstance(body.get("message"), str) or not body["message"].strip():
+            raise _bad_request('Expected a JSON object with a non-empty "message".')
+        try:
+            turn = scheduler.submit(request.match_info["thread_id"], body["message"])
+        except ServerBusy as e:
+            return _busy_response(e)
+        # Tokens are only sent over the websocket, the answers contain the same text
+        events = [event async for event in turn.stream() if event["type"] != "token"]
+        return web.json_response({"events": events}, status=500 if events[-1]["type"] == "error" else 200)
+
+    @routes.get("/threads/{thread_id}/ws")
+    async def websocket(request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        thread_id = request.match_info["thread_id"]
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                continue
+            try:
+                turn = scheduler.submit(thread_id, message.data)
+            except ServerBusy as e:
+                await ws.send_json({"type": "error", "error": str(e), "retry_after": e.retry_after})
+                continue
+            # A client that goes away does not cancel its turn, the thread stays consistent and can be resumed
+            async for event in turn.stream():
+                if not ws.closed:
+                    await ws.send_json(event)
+        return ws
+
+    @routes.get("/threads/{thread_id}")
+    async def get_thread(request: web.Request) -> web.Response:
+        state = await scheduler.thread_state(request.match_info["thread_id"])
+        if state is None:
+            return web.json_response({"error": "Unknown thread."}, status=404)
+        return web.json_response(state)
+
+    @routes.delete("/threads/{thread_id}")
+    async def delete_thread(request: web.Request) -> web.Response:
+        try:
+            deleted = await scheduler.delete_thread(request.match_info["thread_id"])
+        except ServerBusy as e:
+            return web.json_response({"error": str(e)}, status=409)
+        return web.Response(status=204) if deleted else web.json_response({"error": "The checkpointer cannot delete threads."}, status=501)
+
+    @routes.get("/stats")
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(scheduler.stats())
+
+    async def on_startup(app: web.Application):
+        await scheduler.start()
+
+    async def on_shutdown(app: web.Application):
+        await scheduler.stop()
+
+    app = web.Application()
+    app.add_routes(routes)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+def build_graph() -> CompiledStateGraph:
+    """Compiles the sample's agents once for all users, with a checkpointer that keeps their threads apart."""
+    from langgraph.checkpoint.memory import MemorySaver
+    from app import graph
+
+    if graph.checkpointer is not None:
+        return graph
+    # Without AGENT_CHECKPOINT_DB the threads live as long as the process
+    served = graph.builder.compile(checkpointer=MemorySaver())
+    served.name = graph.name
+    return served
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves the product search graph to many users over HTTP and websockets.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8080)))
+    parser.add_argument("--max-concurrency", type=int, default=8, help="Turns that run at the same time")
+    parser.add_argument("--max-pending-per-thread", type=int, default=4)
+    parser.add_argument("--turn-timeout", type=float, default=300.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    scheduler = TurnScheduler(build_graph(), max_concurrency=args.max_concurrency, max_pending_per_thread=args.max_pending_per_thread,
+                              turn_timeout=args.turn_timeout)
+    web.run_app(create_app(scheduler), host=args.host, port=args.port)
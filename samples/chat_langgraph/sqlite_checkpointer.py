@@ -0,0 +1,325 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import zlib
+from functools import partial
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_serializable_checkpoint_metadata,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    message_ids TEXT,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    message_id TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, message_id)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_updated_at ON threads (updated_at);
+"""
+
+# Separates message ids in the message_ids column, ids are uuids and never contain it
+_ID_SEPARATOR = ","
+
+class SQLiteDeltaSaver(BaseCheckpointSaver):
+    """LangGraph checkpointer backed by a local SQLite database that stores message deltas.
+
+    Messages of the message channel are written once per thread into their own table and every checkpoint only
+    keeps the ordered list of message ids, so a new checkpoint costs the new messages instead of the whole history.
+    Values are serialized with the graph's serializer and zlib compressed above a size threshold. Threads that were
+    not updated for ttl_seconds are removed, and keep_last limits how many checkpoints are kept per thread.
+
+    Messages are treated as immutable once written, which holds for AgentSystem graphs where every update appends
+    new messages. A list that does not extend its parent's list is rewritten in full.
+    """
+
+    def __init__(self, path: str = "checkpoints.sqlite", message_channel: str = "messages", ttl_seconds: Optional[float] = None,
+                 keep_last: Optional[int] = None, compress_threshold: int = 512, cleanup_interval: float = 300.0, serde=None):
+        super().__init__(serde=serde)
+        self.message_channel = message_channel
+        self.ttl_seconds = ttl_seconds
+        self.keep_last = keep_last
+        self.compress_threshold = compress_threshold
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _dump(self, value: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) > self.compress_threshold:
+            return f"z:{type_}", zlib.compress(data)
+        return type_, data
+
+    def _load(self, type_: str, data: bytes) -> Any:
+        if type_.startswith("z:"):
+            return self.serde.loads_typed((type_[2:], zlib.decompress(data)))
+        return self.serde.loads_typed((type_, data))
+
+    def _split_messages(self, values: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[List[BaseMessage]]]:
+        messages = values.get(self.message_channel)
+        if not isinstance(messages, list) or not all(isinstance(m, BaseMessage) and m.id for m in messages):
+            return values, None
+        return {k: v for k, v in values.items() if k != self.message_channel}, messages
+
+    def _load_messages(self, thread_id: str, checkpoint_ns: str, message_ids: str) -> List[BaseMessage]:
+        ids = message_ids.split(_ID_SEPARATOR) if message_ids else []
+        stored: Dict[str, BaseMessage] = {}
+        # Stay below SQLite's host parameter limit
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT message_id, type, value FROM messages WHERE thread_id = ? AND checkpoint_ns = ? AND message_id IN ({','.join('?' * len(chunk))})",
+                (thread_id, checkpoint_ns, *chunk),
+            ).fetchall()
+            stored.update({message_id: self._load(type_, value) for message_id, type_, value in rows})
+        return [stored[message_id] for message_id in ids if message_id in stored]
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata, message_ids = row
+        checkpoint = self._load(type_, checkpoint)
+        if message_ids is not None:
+            checkpoint["channel_values"][self.message_channel] = self._load_messages(thread_id, checkpoint_ns, message_ids)
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=checkpoint,
+            metadata=self._load(metadata_type, metadata),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}}
+                if parent_checkpoint_id else None
+            ),
+            pending_writes=[(task_id, channel, self._load(t, value)) for task_id, channel, t, value in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata, message_ids"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                # Checkpoint ids increase monotonically, the primary key index makes this a single seek
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            return self._to_tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata, message_ids FROM checkpoints"
+        clauses, params = [], []
+        if config is not None:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        count = 0
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and count >= limit:
+                return
+            with self._lock:
+                checkpoint_tuple = self._to_tuple(thread_id, checkpoint_ns, tuple(row))
+            if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            count += 1
+            yield checkpoint_tuple
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+
+        values, messages = self._split_messages(checkpoint["channel_values"])
+        stored = {**checkpoint, "channel_values": values}
+        type_, data = self._dump(stored)
+        # The node outputs in the metadata duplicate the messages, they are not needed to resume
+        metadata_type, metadata_data = self._dump(get_serializable_checkpoint_metadata(config, metadata))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                message_ids = None
+                if messages is not None:
+                    ids = [message.id for message in messages]
+                    message_ids = _ID_SEPARATOR.join(ids)
+                    known: List[str] = []
+                    if parent_checkpoint_id:
+                        row = self._conn.execute(
+                            "SELECT message_ids FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                            (thread_id, checkpoint_ns, parent_checkpoint_id),
+                        ).fetchone()
+                        known = row[0].split(_ID_SEPARATOR) if row and row[0] else []
+                    # Only an append to the parent's list can reuse the stored messages
+                    start = len(known) if ids[:len(known)] == known else 0
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO messages (thread_id, checkpoint_ns, message_id, type, value) VALUES (?, ?, ?, ?, ?)",
+                        [(thread_id, checkpoint_ns, message.id, *self._dump(message)) for message in messages[start:]],
+                    )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata, message_ids) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id, type_, data, metadata_type, metadata_data, message_ids),
+                )
+                self._conn.execute("INSERT OR REPLACE INTO threads (thread_id, updated_at) VALUES (?, ?)", (thread_id, time.time()))
+                if self.keep_last is not None:
+                    self._prune(thread_id, checkpoint_ns)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if self.ttl_seconds is not None and time.monotonic() - self._last_cleanup > self.cleanup_interval:
+            self.cleanup()
+
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        stale = self._conn.execute(
+            "SELECT checkpoint_id, message_ids FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_last),
+        ).fetchall()
+        if not stale:
+            return
+        for checkpoint_id, _ in stale:
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id))
+            self._conn.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", (thread_id, checkpoint_ns, checkpoint_id))
+        # Messages of the removed checkpoints that no remaining checkpoint references, e.g. after a rewritten history
+        candidates = {message_id for _, message_ids in stale if message_ids for message_id in message_ids.split(_ID_SEPARATOR)}
+        for (message_ids,) in self._conn.execute(
+            "SELECT message_ids FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND message_ids IS NOT NULL", (thread_id, checkpoint_ns),
+        ).fetchall():
+            candidates.difference_update(message_ids.split(_ID_SEPARATOR) if message_ids else ())
+        self._conn.executemany(
+            "DELETE FROM messages WHERE thread_id = ? AND checkpoint_ns = ? AND message_id = ?",
+            [(thread_id, checkpoint_ns, message_id) for message_id in candidates],
+        )
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Special writes such as interrupts replace earlier ones, regular writes are written once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        rows = [
+            (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, *self._dump(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._delete_threads([thread_id])
+
+    def _delete_threads(self, thread_ids: List[str]):
+        self._conn.execute("BEGIN")
+        try:
+            for table in ("checkpoints", "writes", "messages", "threads"):
+                self._conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(thread_id,) for thread_id in thread_ids])
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def cleanup(self, ttl_seconds: Optional[float] = None) -> int:
+        """Deletes threads that were not updated within the TTL and returns how many were removed."""
+        ttl_seconds = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        if ttl_seconds is None:
+            return 0
+        with self._lock:
+            self._last_cleanup = time.monotonic()
+            expired = [row[0] for row in self._conn.execute("SELECT thread_id FROM threads WHERE updated_at < ?", (time.time() - ttl_seconds,))]
+            if expired:
+                self._delete_threads(expired)
+        return len(expired)
+
+    async def _run(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, partial(fn, *args, **kwargs))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self._run(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        for checkpoint_tuple in await self._run(lambda: list(self.list(config, filter=filter, before=before, limit=limit))):
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        return await self._run(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        await self._run(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await self._run(self.delete_thread, thread_id)
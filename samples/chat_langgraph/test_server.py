@@ -0,0 +1,47 @@
+import asyncio
+import json
+import os
+os.environ.setdefault("TRACING_EXPORTER", "none")
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import MemorySaver
+from bench_agent import build_system
+from fake_llm import FakeChatModel
+from server import ServerBusy, TurnScheduler, create_app
+
+def _scheduler(**options) -> TurnScheduler:
+    route = json.dumps({"result": "Here are some tables.", "goto": "human_input_agent", "capability_description": "table search"})
+    agents = build_system(FakeChatModel(responses=[AIMessage(content=route)]))
+    return TurnScheduler(agents._graph.compile(checkpointer=MemorySaver()), **options)
+
+def test_invalid_turn_bodies_are_rejected():
+    async def run():
+        async with TestClient(TestServer(create_app(_scheduler()))) as client:
+            responses = [
+                await client.post("/threads/t/turns", data="{not json", headers={"content-type": "application/json"}),
+                await client.post("/threads/t/turns", json=["I need a table."]),
+                await client.post("/threads/t/turns", json="I need a table."),
+                await client.post("/threads/t/turns", json={"message": " "}),
+            ]
+            return [(response.status, await response.json()) for response in responses]
+
+    for status, body in asyncio.run(run()):
+        assert status == 400
+        assert body["error"]
+
+def test_rejected_turns_do_not_leave_thread_queues():
+    async def run():
+        scheduler = _scheduler(max_pending=2)
+        # Not started, so the accepted turns stay queued
+        scheduler._accepting = True
+        scheduler.submit("a", "I need a table.")
+        scheduler.submit("b", "I need a table.")
+        for i in range(100):
+            with pytest.raises(ServerBusy):
+                scheduler.submit(f"new-{i}", "I need a table.")
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    assert set(scheduler._pending) == {"a", "b"}
+    assert list(scheduler._ready) == ["a", "b"]
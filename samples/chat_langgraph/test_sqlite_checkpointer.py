@@ -0,0 +1,71 @@
+import time
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langgraph.graph import START, MessagesState, StateGraph
+from sqlite_checkpointer import SQLiteDeltaSaver
+
+def _graph(checkpointer: SQLiteDeltaSaver):
+    def answer(state: MessagesState):
+        return {"messages": [AIMessage(f"Answer {len(state['messages'])}")]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("answer", answer)
+    graph.add_edge(START, "answer")
+    return graph.compile(checkpointer=checkpointer)
+
+def _config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+def _count(saver: SQLiteDeltaSaver, table: str, thread_id: str) -> int:
+    return saver._conn.execute(f"SELECT COUNT(*) FROM {table} WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+def test_put_and_get_round_trip(tmp_path):
+    saver = SQLiteDeltaSaver(str(tmp_path / "checkpoints.sqlite"))
+    graph = _graph(saver)
+    graph.invoke({"messages": [HumanMessage("I need a table." * 100)]}, _config("a"))
+    graph.invoke({"messages": [HumanMessage("The first one.")]}, _config("a"))
+
+    checkpoint_tuple = saver.get_tuple(_config("a"))
+    messages = checkpoint_tuple.checkpoint["channel_values"]["messages"]
+    assert [message.content for message in messages] == ["I need a table." * 100, "Answer 1", "The first one.", "Answer 3"]
+    assert messages == graph.get_state(_config("a")).values["messages"]
+    # Every message is stored once although each checkpoint references the history
+    assert _count(saver, "messages", "a") == 4
+    assert saver.get_tuple({"configurable": {**checkpoint_tuple.parent_config["configurable"]}}) is not None
+    assert len(list(saver.list(_config("a")))) == _count(saver, "checkpoints", "a")
+
+def test_resume_from_another_saver(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    _graph(SQLiteDeltaSaver(path)).invoke({"messages": [HumanMessage("Hello")]}, _config("a"))
+
+    graph = _graph(SQLiteDeltaSaver(path))
+    result = graph.invoke({"messages": [HumanMessage("Again")]}, _config("a"))
+    assert [message.content for message in result["messages"]] == ["Hello", "Answer 1", "Again", "Answer 3"]
+
+def test_ttl_cleanup_removes_idle_threads(tmp_path):
+    saver = SQLiteDeltaSaver(str(tmp_path / "checkpoints.sqlite"), ttl_seconds=60)
+    graph = _graph(saver)
+    graph.invoke({"messages": [HumanMessage("Old")]}, _config("old"))
+    graph.invoke({"messages": [HumanMessage("New")]}, _config("new"))
+    saver._conn.execute("UPDATE threads SET updated_at = ? WHERE thread_id = 'old'", (time.time() - 120,))
+
+    assert saver.cleanup() == 1
+    assert saver.get_tuple(_config("old")) is None
+    assert all(_count(saver, table, "old") == 0 for table in ("checkpoints", "writes", "messages", "threads"))
+    assert saver.get_tuple(_config("new")) is not None
+
+def test_keep_last_prunes_checkpoints_and_unreferenced_messages(tmp_path):
+    saver = SQLiteDeltaSaver(str(tmp_path / "checkpoints.sqlite"), keep_last=2)
+    graph = _graph(saver)
+    for text in ("One", "Two", "Three"):
+        graph.invoke({"messages": [HumanMessage(text)]}, _config("a"))
+    assert _count(saver, "checkpoints", "a") == 2
+
+    # Removing messages rewrites the history, the removed ones are dropped once no kept checkpoint references them
+    messages = graph.get_state(_config("a")).values["messages"]
+    graph.update_state(_config("a"), {"messages": [RemoveMessage(id=message.id) for message in messages[:4]]})
+    graph.invoke({"messages": [HumanMessage("Four")]}, _config("a"))
+
+    kept = graph.get_state(_config("a")).values["messages"]
+    assert [message.content for message in kept] == ["Three", "Answer 5", "Four", "Answer 3"]
+    assert _count(saver, "checkpoints", "a") == 2
+    assert _count(saver, "messages", "a") == len(kept)
@@ -1,19 +1,166 @@
-from typing import Any
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, asdict, field
+from typing import Any, Deque, Dict, List, Optional
 from uuid import UUID
 from langchain_core.callbacks import BaseCallbackHandler
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, BaseMessage
 from langchain_core.outputs.llm_result import LLMResult
 
-class TokenCounterCallback(BaseCallbackHandler):
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+@dataclass
+class Usage:
+    calls: int = 0
+    errors: int = 0
     prompt_tokens: int = 0
     completion_tokens: int = 0
-    total_tokens: int = 0
+    # Prompt tokens served from the provider's prompt cache, included in prompt_tokens
+    cached_tokens: int = 0
+    latency: Deque[float] = field(default_factory=deque)
+    time_to_first_token: Deque[float] = field(default_factory=deque)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {k: v for k, v in asdict(self).items() if k not in ("latency", "time_to_first_token")}
+        data["total_tokens"] = self.prompt_tokens + self.completion_tokens
+        data["cached_ratio"] = self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+        for name, values in (("latency", list(self.latency)), ("time_to_first_token", list(self.time_to_first_token))):
+            data[name] = {f"p{p}": _percentile(values, p) for p in (50, 90, 99)}
+        return data
+
+@dataclass
+class _Run:
+    agent: str
+    thread_id: Optional[str]
+    started: float
+    first_token: Optional[float] = None
+
+class TokenCounterCallback(BaseCallbackHandler):
+    """Accounts tokens and latency of every model call by agent node and conversation thread.
+
+    The agent is the LangGraph node that made the call and the thread the configured thread_id. Latencies are
+    kept for the last window calls per agent and thread, the usage of at most max_threads threads is kept.
+    """
+
+    # Handle callbacks on the calling thread, the state is guarded by a lock
+    run_inline = True
+
+    def __init__(self, window: int = 1000, max_threads: int = 10000):
+        self.window = window
+        self.max_threads = max_threads
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.cached_tokens = 0
+        # Prompt tokens removed from the history by context compaction
+        self.compacted_tokens = 0
+        self._runs: Dict[UUID, _Run] = {}
+        self._agents: Dict[str, Usage] = {}
+        self._threads: OrderedDict[str, Usage] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _usage(self, registry: Dict[str, Usage], key: str) -> Usage:
+        if key not in registry:
+            registry[key] = Usage(latency=deque(maxlen=self.window), time_to_first_token=deque(maxlen=self.window))
+        return registry[key]
+
+    def _start(self, run_id: UUID, metadata: Optional[Dict[str, Any]]):
+        metadata = metadata or {}
+        with self._lock:
+            self._runs[run_id] = _Run(
+                agent=metadata.get("langgraph_node", "unknown"),
+                thread_id=metadata.get("thread_id"),
+                started=time.perf_counter(),
+            )
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        self._start(run_id, metadata)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        self._start(run_id, metadata)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> Any:
+        run = self._runs.get(run_id)
+        if run is not None and run.first_token is None:
+            run.first_token = time.perf_counter()
+
+    def _usages(self, run: _Run) -> List[Usage]:
+        usages = [self._usage(self._agents, run.agent)]
+        if run.thread_id is not None:
+            usages.append(self._usage(self._threads, run.thread_id))
+            self._threads.move_to_end(run.thread_id)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+        return usages
 
     def on_llm_end(self, response: LLMResult, *, run_id: UUID, parent_run_id: UUID | None = None, **kwargs: Any) -> Any:
+        prompt_tokens = completion_tokens = cached_tokens = 0
         for result in response.flatten():
             generation = result.generations[0][0]
             if isinstance(generation.message, AIMessage):
-                self.completion_tokens += generation.message.usage_metadata.get("output_tokens", 0)
-                self.prompt_tokens += generation.message.usage_metadata.get("input_tokens", 0)
-        self.total_tokens = self.completion_tokens + self.prompt_tokens
-        return
\ No newline at end of file
+                usage_metadata = generation.message.usage_metadata or {}
+                completion_tokens += usage_metadata.get("output_tokens", 0)
+                prompt_tokens += usage_metadata.get("input_tokens", 0)
+                cached_tokens += (usage_metadata.get("input_token_details") or {}).get("cache_read", 0) or 0
+
+        ended = time.perf_counter()
+        with self._lock:
+            self.completion_tokens += completion_tokens
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.total_tokens = self.completion_tokens + self.prompt_tokens
+            run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            for usage in self._usages(run):
+                usage.calls += 1
+                usage.prompt_tokens += prompt_tokens
+                usage.completion_tokens += completion_tokens
+                usage.cached_tokens += cached_tokens
+                usage.latency.append(ended - run.started)
+                if run.first_token is not None:
+                    usage.time_to_first_token.append(run.first_token - run.started)
+        return
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is not None:
+                for usage in self._usages(run):
+                    usage.errors += 1
+
+    def on_context_compacted(self, tokens_before: int, tokens_after: int) -> None:
+        with self._lock:
+            self.compacted_tokens += tokens_before - tokens_after
+
+    def by_agent(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {agent: usage.to_dict() for agent, usage in self._agents.items()}
+
+    def by_thread(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            usage = self._threads.get(thread_id)
+            return usage.to_dict() if usage is not None else None
+
+    def export(self) -> Dict[str, Any]:
+        """Returns a JSON serializable snapshot of the totals, the agents and the threads."""
+        with self._lock:
+            return {
+                "totals": {
+                    "prompt_tokens": self.prompt_tokens,
+                    "completion_tokens": self.completion_tokens,
+                    "total_tokens": self.total_tokens,
+                    "cached_tokens": self.cached_tokens,
+                    "cached_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                    "compacted_tokens": self.compacted_tokens,
+                },
+                "agents": {agent: usage.to_dict() for agent, usage in self._agents.items()},
+                "threads": {thread_id: usage.to_dict() for thread_id, usage in self._threads.items()},
+            }
@@ -0,0 +1,244 @@
+import asyncio
+import contextvars
+import json
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from langchain_core.messages import AIMessage, AnyMessage, ToolCall, ToolMessage
+from langchain_core.runnables.config import RunnableConfig
+from langchain_core.tools import BaseTool
+from langgraph.errors import GraphBubbleUp
+from langgraph.prebuilt.tool_node import msg_content_output
+from langgraph.types import Command
+from langgraph.utils.runnable import RunnableCallable
+from opentelemetry.trace import Status, StatusCode, Tracer
+
+# Per event loop and tool name, so the limits hold across agents and graph runs that share a loop
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+# Per tool name for sync tools, they run on the shared executor whichever loop or thread called them
+_thread_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_thread_semaphores_lock = threading.Lock()
+# Never shut down by a graph run, so a timed out call does not hold up the turn that gave up on it
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="tool")
+
+ToolResult = Union[ToolMessage, Command]
+
+def _call_key(tool_call: ToolCall, shared: bool = True) -> Tuple[str, str]:
+    key = json.dumps(tool_call["args"], sort_keys=True, default=str)
+    return tool_call["name"], key if shared else f"{tool_call['id']}:{key}"
+
+def _has_injected_args(tool: BaseTool) -> bool:
+    """True if the tool gets arguments that the model does not see, e.g. its tool call id."""
+    try:
+        return set(tool.args) != set(tool.tool_call_schema.model_json_schema().get("properties", {}))
+    except (AttributeError, TypeError):
+        return False
+
+def _is_async(tool: BaseTool) -> bool:
+    if hasattr(tool, "coroutine"):
+        return tool.coroutine is not None
+    return type(tool)._arun is not BaseTool._arun
+
+def _error(tool_call: ToolCall, content: str) -> ToolMessage:
+    return ToolMessage(content=content, name=tool_call["name"], tool_call_id=tool_call["id"], status="error")
+
+class ParallelToolNode(RunnableCallable):
+    """Graph node that runs the tool calls of the last AI message concurrently.
+
+    Tools are invoked with the tool call like ToolNode does, so they can return a ToolMessage or a Command. Identical
+    calls within a turn run once and share their result, unless the tool has injected arguments such as its call id. Each tool is limited to max_concurrency parallel calls and
+    timeout seconds per call, both can be overridden per tool with the "max_concurrency" and "timeout" keys of the
+    tool's metadata. Sync tools run on a shared executor and share the limit across all turns and threads of the
+    process, async tools across everything on the same event loop. A timed out call keeps its slot until it returns.
+    Failures and timeouts are returned to the model as error tool messages, like ToolNode does.
+    """
+
+    def __init__(self, tools: Sequence[BaseTool], tracer: Optional[Tracer] = None, timeout: Optional[float] = 30.0,
+                 max_concurrency: int = 8, name: str = "tools"):
+        super().__init__(self._func, self._afunc, name=name, trace=False)
+        self.tools_by_name: Dict[str, BaseTool] = {tool.name: tool for tool in tools}
+        self._unshared = {tool.name for tool in tools if _has_injected_args(tool)}
+        self.tracer = tracer
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+
+    def _option(self, tool: BaseTool, key: str, default: Any) -> Any:
+        return (tool.metadata or {}).get(key, default)
+
+    def _semaphore(self, tool: BaseTool) -> asyncio.Semaphore:
+        limits = _semaphores.setdefault(asyncio.get_running_loop(), {})
+        if tool.name not in limits:
+            limits[tool.name] = asyncio.Semaphore(self._option(tool, "max_concurrency", self.max_concurrency))
+        return limits[tool.name]
+
+    def _thread_semaphore(self, tool: BaseTool) -> threading.BoundedSemaphore:
+        with _thread_semaphores_lock:
+            if tool.name not in _thread_semaphores:
+                _thread_semaphores[tool.name] = threading.BoundedSemaphore(self._option(tool, "max_concurrency", self.max_concurrency))
+            return _thread_semaphores[tool.name]
+
+    def _submit(self, tool: BaseTool, tool_call: ToolCall, config: RunnableConfig) -> Tuple["Future[float]", "Future[Any]"]:
+        """Runs a sync tool on the shared executor, returns futures for its start time and its result."""
+        semaphore = self._thread_semaphore(tool)
+        started: "Future[float]" = Future()
+
+        def run() -> Any:
+            # Held until the tool returns, a call that timed out still counts against the limit
+            with semaphore:
+                started.set_result(time.perf_counter())
+                return tool.invoke({**tool_call, "type": "tool_call"}, config)
+
+        return started, _executor.submit(contextvars.copy_context().run, run)
+
+    def _func(self, input: Dict[str, Any], config: RunnableConfig) -> Any:
+        def run_all(tool_calls: List[ToolCall]) -> List[ToolResult]:
+            # One waiting thread per call, the tools themselves run on the shared executor
+            with ThreadPoolExecutor(max_workers=max(1, len(tool_calls))) as waiters:
+                futures = [waiters.submit(contextvars.copy_context().run, self._run, tool_call, config) for tool_call in tool_calls]
+                return [future.result() for future in futures]
+
+        calls = self._unique_calls(input)
+        outputs, reruns = self._share(input, dict(zip(calls.keys(), run_all(list(calls.values())))))
+        for index, result in zip(reruns, run_all([outputs[index] for index in reruns])):
+            outputs[index] = result
+        return self._combine(outputs)
+
+    async def _afunc(self, input: Dict[str, Any], config: RunnableConfig) -> Any:
+        async def run_all(tool_calls: List[ToolCall]) -> List[ToolResult]:
+            return await asyncio.gather(*(self._arun(tool_call, config) for tool_call in tool_calls))
+
+        calls = self._unique_calls(input)
+        outputs, reruns = self._share(input, dict(zip(calls.keys(), await run_all(list(calls.values())))))
+        for index, result in zip(reruns, await run_all([outputs[index] for index in reruns])):
+            outputs[index] = result
+        return self._combine(outputs)
+
+    def _key(self, tool_call: ToolCall) -> Tuple[str, str]:
+        return _call_key(tool_call, shared=tool_call["name"] not in self._unshared)
+
+    def _unique_calls(self, input: Dict[str, Any]) -> Dict[Tuple[str, str], ToolCall]:
+        calls: Dict[Tuple[str, str], ToolCall] = {}
+        for tool_call in self._last_ai_message(input["messages"]).tool_calls:
+            calls.setdefault(self._key(tool_call), tool_call)
+        return calls
+
+    def _share(self, input: Dict[str, Any], by_key: Dict[Tuple[str, str], ToolResult]) -> Tuple[list, List[int]]:
+        """Returns a result per tool call and the positions of the duplicate calls that have to run on their own.
+
+        A tool message is copied for the duplicate calls, a Command answers exactly the call that produced it, so
+        duplicates of that call are left in the list to be run again.
+        """
+        outputs, reruns = [], []
+        seen = set()
+        for tool_call in self._last_ai_message(input["messages"]).tool_calls:
+            key = self._key(tool_call)
+            result = by_key[key]
+            if key not in seen:
+                seen.add(key)
+                outputs.append(result)
+            elif isinstance(result, ToolMessage):
+                outputs.append(result.model_copy(update={"tool_call_id": tool_call["id"]}))
+            else:
+                reruns.append(len(outputs))
+                outputs.append(tool_call)
+        return outputs, reruns
+
+    def _combine(self, outputs: List[ToolResult]) -> Any:
+        if not any(isinstance(output, Command) for output in outputs):
+            return {"messages": outputs}
+        # LangGraph applies a list of Commands and state updates one after another, like ToolNode returns them
+        return [output if isinstance(output, Command) else {"messages": [output]} for output in outputs]
+
+    def _last_ai_message(self, messages: List[AnyMessage]) -> AIMessage:
+        for message in reversed(messages):
+            if isinstance(message, AIMessage):
+                return message
+        raise ValueError("No AIMessage found in input")
+
+    def _result(self, tool_call: ToolCall, response: Any) -> ToolResult:
+        if isinstance(response, Command):
+            return response
+        if isinstance(response, ToolMessage):
+            response.content = msg_content_output(response.content)
+            return response
+        return ToolMessage(content=msg_content_output(response), name=tool_call["name"], tool_call_id=tool_call["id"])
+
+    def _invalid(self, tool_call: ToolCall) -> ToolMessage:
+        return _error(tool_call, f"Error: {tool_call['name']} is not a valid tool, try one of [{', '.join(self.tools_by_name)}].")
+
+    def _finish(self, tool: BaseTool, tool_call: ToolCall, timeout: Optional[float], response: Any, error: Optional[BaseException]) -> ToolResult:
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+            return _error(tool_call, f"Error: {tool.name} did not finish within {timeout} seconds.")
+        if error is not None:
+            return _error(tool_call, f"Error: {repr(error)}\n Please fix your mistakes.")
+        return self._result(tool_call, response)
+
+    def _record(self, span, queued: float, started: Optional[float], result: ToolResult):
+        if span is None:
+            return
+        if started is not None:
+            span.set_attribute("tool.queue_ms", (started - queued) * 1000)
+            span.set_attribute("tool.duration_ms", (time.perf_counter() - started) * 1000)
+        if isinstance(result, ToolMessage) and result.status == "error":
+            span.set_status(Status(StatusCode.ERROR, str(result.content)))
+
+    def _run(self, tool_call: ToolCall, config: RunnableConfig) -> ToolResult:
+        tool = self.tools_by_name.get(tool_call["name"])
+        if tool is None:
+            return self._invalid(tool_call)
+        if self.tracer is None:
+            return self._execute(tool, tool_call, config, None)
+        with self.tracer.start_as_current_span(tool.name) as span:
+            span.set_attribute("tool.call_id", tool_call["id"] or "")
+            return self._execute(tool, tool_call, config, span)
+
+    async def _arun(self, tool_call: ToolCall, config: RunnableConfig) -> ToolResult:
+        tool = self.tools_by_name.get(tool_call["name"])
+        if tool is None:
+            return self._invalid(tool_call)
+        if self.tracer is None:
+            return await self._aexecute(tool, tool_call, config, None)
+        with self.tracer.start_as_current_span(tool.name) as span:
+            span.set_attribute("tool.call_id", tool_call["id"] or "")
+            return await self._aexecute(tool, tool_call, config, span)
+
+    def _execute(self, tool: BaseTool, tool_call: ToolCall, config: RunnableConfig, span) -> ToolResult:
+        timeout = self._option(tool, "timeout", self.timeout)
+        queued, started_at, response, error = time.perf_counter(), None, None, None
+        try:
+            started, future = self._submit(tool, tool_call, config)
+            started_at = started.result()
+            response = future.result(timeout)
+        except GraphBubbleUp:
+            raise
+        except Exception as e:
+            error = e
+        result = self._finish(tool, tool_call, timeout, response, error)
+        self._record(span, queued, started_at, result)
+        return result
+
+    async def _aexecute(self, tool: BaseTool, tool_call: ToolCall, config: RunnableConfig, span) -> ToolResult:
+        timeout = self._option(tool, "timeout", self.timeout)
+        queued, started_at, response, error = time.perf_counter(), None, None, None
+        try:
+            if _is_async(tool):
+                semaphore = self._semaphore(tool)
+                await semaphore.acquire()
+                started_at = time.perf_counter()
+                task = asyncio.ensure_future(tool.ainvoke({**tool_call, "type": "tool_call"}, config))
+                # Released once the call really ended, wait_for cancels the task on a timeout and waits for it
+                task.add_done_callback(lambda _: semaphore.release())
+                response = await asyncio.wait_for(task, timeout)
+            else:
+                started, future = self._submit(tool, tool_call, config)
+                started_at = await asyncio.shield(asyncio.wrap_future(started))
+                response = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except GraphBubbleUp:
+            raise
+        except Exception as e:
+            error = e
+        result = self._finish(tool, tool_call, timeout, response, error)
+        self._record(span, queued, started_at, result)
+        return result
@@ -1,31 +1,124 @@
-
 import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
 from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter
 from openinference.instrumentation.langchain import LangChainInstrumentor
 from opentelemetry import trace, trace as trace_api
-from opentelemetry.trace import Tracer
+from opentelemetry.context import Context
+from opentelemetry.trace import StatusCode, Tracer
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.instrumentation.langchain import LangchainInstrumentor
 from opentelemetry.sdk import trace as trace_sdk
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import ParentBasedTraceIdRatio
+
+class TailSamplingProcessor(SpanProcessor):
+    """Buffers the spans of a trace until its root span ends and only exports traces that failed or were slow.
+
+    At most max_traces unfinished traces of max_spans spans each are buffered, the oldest trace is dropped first.
+    """
+
+    def __init__(self, delegate: SpanProcessor, min_duration_ms: float, max_traces: int = 1024, max_spans: int = 512):
+        self.delegate = delegate
+        self.min_duration_ns = min_duration_ms * 1_000_000
+        self.max_traces = max_traces
+        self.max_spans = max_spans
+        self._traces: OrderedDict[int, List[ReadableSpan]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None):
+        self.delegate.on_start(span, parent_context)
+
+    def on_end(self, span: ReadableSpan):
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+        with self._lock:
+            spans = self._traces.pop(trace_id, [])
+            if len(spans) < self.max_spans:
+                spans.append(span)
+            if not is_root:
+                self._traces[trace_id] = spans
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+                return
+
+        failed = any(s.status.status_code == StatusCode.ERROR for s in spans)
+        if failed or span.end_time - span.start_time >= self.min_duration_ns:
+            for s in spans:
+                self.delegate.on_end(s)
+
+    def shutdown(self):
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.delegate.force_flush(timeout_millis)
 
 class AppInsightsTracer():
+    """Process wide tracer, every AgentSystem shares the provider, span processor and instrumentation.
+
+    Configured on first use from the environment:
+    TRACING_EXPORTER: azure (default with APPLICATIONINSIGHTS_CONNECTION_STRING), console, memory or none
+    TRACING_SAMPLE_RATIO: share of traces that are recorded at all (head sampling), defaults to 1.0
+    TRACING_TAIL_MIN_DURATION_MS: if set, only traces that failed or took at least this long are exported
+    TRACING_INSTRUMENT_LANGCHAIN: set to false to only record the agent and tool spans
+    TRACING_MAX_QUEUE_SIZE, TRACING_MAX_EXPORT_BATCH_SIZE, TRACING_SCHEDULE_DELAY_MS: batch processor bounds
+    """
 
-    def __init__(self):
-        self.tracer = self._setup_tracing()
+    _instance: Optional["AppInsightsTracer"] = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super().__new__(cls)
+                instance.memory_exporter = None
+                instance.tracer = instance._setup_tracing()
+                cls._instance = instance
+            return cls._instance
 
     def get_tracer(self) -> Tracer:
         return self.tracer
 
+    def _create_exporter(self, name: str):
+        match name:
+            case "azure":
+                return AzureMonitorTraceExporter.from_connection_string(
+                    os.environ["APPLICATIONINSIGHTS_CONNECTION_STRING"]
+                )
+            case "console":
+                return ConsoleSpanExporter()
+            case "memory":
+                self.memory_exporter = InMemorySpanExporter()
+                return self.memory_exporter
+            case "none":
+                return None
+        raise ValueError(f"Unknown TRACING_EXPORTER {name}")
+
     def _setup_tracing(self):
-        exporter = AzureMonitorTraceExporter.from_connection_string(
-            os.environ["APPLICATIONINSIGHTS_CONNECTION_STRING"]
-        )
-        tracer_provider = TracerProvider()
+        env: Dict[str, str] = os.environ
+        default_exporter = "azure" if env.get("APPLICATIONINSIGHTS_CONNECTION_STRING") else "none"
+        exporter = self._create_exporter(env.get("TRACING_EXPORTER", default_exporter).lower())
+
+        tracer_provider = TracerProvider(sampler=ParentBasedTraceIdRatio(float(env.get("TRACING_SAMPLE_RATIO", 1.0))))
         trace.set_tracer_provider(tracer_provider)
         tracer = trace.get_tracer(__name__)
-        span_processor = BatchSpanProcessor(exporter, schedule_delay_millis=60000)
-        trace.get_tracer_provider().add_span_processor(span_processor)
-        LangchainInstrumentor().instrument()
-        return tracer
\ No newline at end of file
+        if exporter is not None:
+            if isinstance(exporter, InMemorySpanExporter):
+                # Offline tests read the spans right after a run
+                span_processor = SimpleSpanProcessor(exporter)
+            else:
+                span_processor = BatchSpanProcessor(
+                    exporter,
+                    max_queue_size=int(env.get("TRACING_MAX_QUEUE_SIZE", 2048)),
+                    max_export_batch_size=int(env.get("TRACING_MAX_EXPORT_BATCH_SIZE", 512)),
+                    schedule_delay_millis=float(env.get("TRACING_SCHEDULE_DELAY_MS", 5000)),
+                )
+            if "TRACING_TAIL_MIN_DURATION_MS" in env:
+                span_processor = TailSamplingProcessor(span_processor, float(env["TRACING_TAIL_MIN_DURATION_MS"]))
+            trace.get_tracer_provider().add_span_processor(span_processor)
+            if env.get("TRACING_INSTRUMENT_LANGCHAIN", "true").lower() == "true":
+                LangchainInstrumentor().instrument()
+        return tracer
@@ -1,26 +1,19 @@
-from docling.document_converter import DocumentConverter, PdfFormatOption
+from __future__ import annotations
 from pathlib import Path
-from typing import Iterable
+from typing import TYPE_CHECKING, Iterable
 from dataclasses import dataclass
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-from docling.datamodel.base_models import FigureElement, InputFormat, Table
-from docling_core.types.doc import ImageRefMode, PictureItem, TableItem
-from docling.datamodel.pipeline_options import (
-    AcceleratorDevice,
-    AcceleratorOptions,
-)
-from docling.chunking import HybridChunker
-from docling.datamodel.document import ConversionResult, ConversionStatus
-from azure.identity import DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
-from azure.storage.blob import BlobLeaseClient
-from langchain_openai import AzureOpenAIEmbeddings
-from langchain_community.vectorstores.azuresearch import AzureSearch
+import functools
 import uuid
 import os
 import dotenv
 from ..shared.storage import Container
 
+if TYPE_CHECKING:
+    from docling.document_converter import DocumentConverter
+    from docling.datamodel.document import ConversionResult
+    from langchain_openai import AzureOpenAIEmbeddings
+    from langchain_community.vectorstores.azuresearch import AzureSearch
+
 dotenv.load_dotenv()
 
 IMAGE_RESOLUTION_SCALE = 2.0
@@ -33,20 +26,28 @@ upload_results = os.getenv("UPLOAD_RESULTS", "false").lower() == "true"
 storage_url = os.getenv("STORAGE_ACCOUNT_URL")
 chunking_enabled = os.getenv("CHUNKING_ENABLED", "false").lower() == "true"
 
-embeddings_model = AzureOpenAIEmbeddings(    
-    azure_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
-    openai_api_version = os.getenv("AZURE_OPENAI_API_VERSION"),
-    model= os.getenv("AZURE_OPENAI_EMBEDDING_MODEL"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY")
-)
+# Docling loads its layout and table models with torch, the clients and models are only created once they are needed
+@functools.cache
+def get_embeddings_model() -> AzureOpenAIEmbeddings:
+    from langchain_openai import AzureOpenAIEmbeddings
+    return AzureOpenAIEmbeddings(
+        azure_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME"),
+        openai_api_version = os.getenv("AZURE_OPENAI_API_VERSION"),
+        model= os.getenv("AZURE_OPENAI_EMBEDDING_MODEL"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY")
+    )
 
-@dataclass
-class Document:
-    id: str
-    page_content: str
-    metadata: dict
+@functools.cache
+def get_credential():
+    from azure.identity import DefaultAzureCredential
+    return DefaultAzureCredential()
+
+@functools.cache
+def get_converter() -> DocumentConverter:
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import AcceleratorDevice, AcceleratorOptions, PdfPipelineOptions
 
-def main():
     accelerator_options = AcceleratorOptions(
         num_threads=8, device=AcceleratorDevice.CPU)
 
@@ -55,18 +56,27 @@ def main():
     options.generate_picture_images = True
     options.generate_page_images = True
     options.accelerator_options = accelerator_options
-    converter = DocumentConverter(
+    return DocumentConverter(
         format_options={
             InputFormat.PDF:PdfFormatOption(pipeline_options=options),
         },
     )
 
+@dataclass
+class Document:
+    id: str
+    page_content: str
+    metadata: dict
+
+def main():
+    from docling.datamodel.document import ConversionStatus
+
     search_index = create_search_index()
 
     dir = Path(OUTPUT_DIR)
     dir.mkdir(parents=True, exist_ok=True)
 
-    container = Container(storage_url, DefaultAzureCredential(), DOCUMENT_CONTAINER)
+    container = Container(storage_url, get_credential(), DOCUMENT_CONTAINER)
     container.create_container()
     files = container.get_files()
 
@@ -79,7 +89,7 @@ def main():
         file.lease()
         file.download(file_output_path)
 
-        conversion_result = convert_file(file_output_path, converter)
+        conversion_result = convert_file(file_output_path, get_converter())
 
         if conversion_result.status == ConversionStatus.SUCCESS:
             converted_results_path = store_result_locally(conversion_result)
@@ -92,6 +102,7 @@ def main():
             }
 
             if chunking_enabled:
+                from docling.chunking import HybridChunker
                 chunker = HybridChunker(
                     max_tokens=MAX_TOKENS,
                 )
@@ -107,20 +118,21 @@ def main():
             index_documents(search_index, docs)
 
             if upload_results:
-                upload_container = Container(storage_url, DefaultAzureCredential(), PROCESSED_DOCUMENT_CONTAINER)
+                upload_container = Container(storage_url, get_credential(), PROCESSED_DOCUMENT_CONTAINER)
                 upload_container.upload_from_local(converted_results_path, file.name.rsplit('.', 1)[0], metadata) 
         else:
             file.release_lease()
             print(f"Failed to convert {file.name}")
 
 def create_search_index() -> AzureSearch:
+    from langchain_community.vectorstores.azuresearch import AzureSearch
     index_name: str = "document-index"
 
     return AzureSearch(
         azure_search_endpoint=os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
         azure_search_key=os.getenv("AZURE_AI_SEARCH_KEY"),
         index_name=index_name,
-        embedding_function=embeddings_model.embed_query,
+        embedding_function=get_embeddings_model().embed_query,
     )
 
 def index_documents(search_index: AzureSearch, docs) -> None:
@@ -134,6 +146,8 @@ def convert_file(path: Path, converter: DocumentConverter) -> ConversionResult:
     return converter.convert(path, raises_on_error=False)
 
 def store_result_locally(result: ConversionResult) -> Path:
+    from docling.datamodel.document import ConversionStatus
+    from docling_core.types.doc import ImageRefMode
     if result.status == ConversionStatus.SUCCESS:
         dir = Path(OUTPUT_DIR / Path(result.document.origin.filename).stem)
         dir.mkdir(parents=True, exist_ok=True)
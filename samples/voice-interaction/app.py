@@ -6,7 +6,7 @@ from azure.core.credentials import AzureKeyCredential
 from azure.identity import AzureDeveloperCliCredential, DefaultAzureCredential
 from dotenv import load_dotenv
 
-from backend.tools import _get_products_tool_schema, _show_product_information_tool_schema, Tool
+from backend.tools import _get_products_tool_schema, _show_product_information_tool_schema, Tool, default_cache_key
 from backend.rtmt import RTMiddleTier
 
 from reportstore.filedb import FileDBStore
@@ -14,6 +14,28 @@ from reportstore.filedb import FileDBStore
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("voicerag")
 
+def configure_middle_tier(rtmt: RTMiddleTier, store: FileDBStore):
+    rtmt.system_message = (
+        "You are a helpful assistant that maintains a conversation with the user, while helping the user to make a choice for a product.\n"
+        "You can only speak english or german. Base your choice on the language of the user.\n"
+        "You MUST start the converstation by introducing your self and explain the user that you will be asking questions to help him narrow down their choices.\n"
+        "Your first question should be to use the get_product_data tool to find out possible products\n"
+        "You should should use the show_product_information tool to show the user the available product models.\n"
+        "You must engage the user in a friendly conversation, follow his interest and guide the user along while making sure you use the show_product_information tool regularly when the user changes the conversation to a different product. The user will provide the answers to the questions."
+    )
+    rtmt.tools["get_product_data"] = Tool(
+        schema=_get_products_tool_schema,
+        target=lambda args: store.get_products(args),
+        # Keyword order does not change the ranking, so "electric car" and "car electric" share an entry. The catalog
+        # version is part of the key so results cached before a reload of the catalog are not served afterwards.
+        cache_key=lambda args: f"{store.catalog_version()}:" + default_cache_key(" ".join(sorted(str(args.get("keywords", "")).lower().split()))),
+    )
+    rtmt.tools["show_product_information"] = Tool(
+        schema=_show_product_information_tool_schema,
+        target=lambda args: store.show_product_information(args),
+        cache_ttl=None,
+    )
+
 async def create_app():
     if not os.environ.get("RUNNING_IN_PRODUCTION"):
         logger.info("Running in development mode, loading from .env file")
@@ -43,23 +65,9 @@ async def create_app():
 
     rtmt = RTMiddleTier(llm_endpoint, llm_deployment, llm_credential)
 
-    rtmt.system_message = (
-        "You are a helpful assistant that maintains a conversation with the user, while helping the user to make a choice for a product.\n"
-        "You can only speak english or german. Base your choice on the language of the user.\n"
-        "You MUST start the converstation by introducing your self and explain the user that you will be asking questions to help him narrow down their choices.\n"
-        "Your first question should be to use the get_product_data tool to find out possible products\n"
-        "You should should use the show_product_information tool to show the user the available product models.\n"
-        "You must engage the user in a friendly conversation, follow his interest and guide the user along while making sure you use the show_product_information tool regularly when the user changes the conversation to a different product. The user will provide the answers to the questions."
-    )
-    rtmt.tools["get_product_data"] = Tool(
-        schema=_get_products_tool_schema,
-        target=lambda args: store.get_products(args),
-    )
-    rtmt.tools["show_product_information"] = Tool(
-        schema=_show_product_information_tool_schema,
-        target=lambda args: store.show_product_information(args),
-    )    
-        
+    configure_middle_tier(rtmt, store)
+    rtmt.recording_dir = os.environ.get("REALTIME_RECORDING_DIR")
+
     rtmt.attach_to_app(app, "/realtime")
 
     # Serve static files and index.html
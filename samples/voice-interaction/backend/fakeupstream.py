@@ -0,0 +1,66 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Callable, Optional
+import aiohttp
+from aiohttp import web
+from backend.recording import FROM_SERVER
+
+# Sent after the last recorded frame so clients know the replay is complete
+REPLAY_DONE = "replay.done"
+
+class FakeRealtimeServer:
+    """Local stand-in for the Azure OpenAI realtime endpoint that replays recorded server frames.
+
+    Every replayed frame gets a unique event_id so the receiving side can correlate it with its send time.
+    """
+
+    speed: float
+
+    def __init__(self, frames: list[tuple[float, str, str]], speed: float = 1.0,
+                 on_sent: Optional[Callable[[str], None]] = None,
+                 on_received: Optional[Callable[[str], None]] = None):
+        self.speed = speed
+        self.on_sent = on_sent
+        self.on_received = on_received
+        # Parse once, each session only swaps in its event ids
+        self._frames = [(offset, json.loads(frame)) for offset, direction, frame in frames if direction == FROM_SERVER]
+        # Recordings taken during a replay contain the end marker, it is re-added at the end
+        self._frames = [(offset, message) for offset, message in self._frames if message.get("type") != REPLAY_DONE]
+        self._sessions = itertools.count()
+
+    async def _replay(self, ws: web.WebSocketResponse, session_id: int):
+        start = time.perf_counter()
+        try:
+            for seq, (offset, message) in enumerate(self._frames):
+                delay = offset / 1000 / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                event_id = f"replay_{session_id}_{seq}"
+                data = json.dumps({**message, "event_id": event_id})
+                if self.on_sent is not None:
+                    self.on_sent(event_id)
+                await ws.send_str(data)
+            await ws.send_str(json.dumps({"type": REPLAY_DONE}))
+            await ws.close()
+        except ConnectionResetError:
+            # The middle tier went away before the replay finished
+            pass
+
+    async def _websocket_handler(self, request: web.Request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        replay = asyncio.create_task(self._replay(ws, next(self._sessions)))
+        try:
+            async for msg in ws:
+                if msg.type == aiohttp.WSMsgType.TEXT and self.on_received is not None:
+                    event_id = json.loads(msg.data).get("event_id")
+                    if event_id is not None:
+                        self.on_received(event_id)
+        finally:
+            replay.cancel()
+        return ws
+
+    def attach_to_app(self, app, path: str = "/openai/realtime"):
+        app.router.add_get(path, self._websocket_handler)
@@ -0,0 +1,76 @@
+import base64
+import gzip
+import json
+import os
+import time
+import uuid
+from typing import Optional
+
+# Frame directions, as seen by the middle tier
+FROM_CLIENT = "c"
+FROM_SERVER = "s"
+
+RECORDING_VERSION = 1
+
+class SessionRecorder:
+    """Captures both sides of a realtime session to a gzip compressed JSON lines file.
+
+    The first line is a header, every following line is a compact [offset_ms, direction, frame] triple.
+    """
+
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._file.write(json.dumps({"version": RECORDING_VERSION}) + "\n")
+        self._start = time.perf_counter()
+
+    @classmethod
+    def in_directory(cls, directory: str) -> "SessionRecorder":
+        os.makedirs(directory, exist_ok=True)
+        return cls(os.path.join(directory, f"session-{int(time.time())}-{uuid.uuid4().hex[:8]}.jsonl.gz"))
+
+    def record(self, direction: str, frame: str):
+        if self._file is None:
+            return
+        offset = round((time.perf_counter() - self._start) * 1000, 1)
+        self._file.write(json.dumps([offset, direction, frame], separators=(",", ":")) + "\n")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def load_recording(path: str) -> list[tuple[float, str, str]]:
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        header = json.loads(file.readline())
+        if header.get("version") != RECORDING_VERSION:
+            raise ValueError(f"Unsupported recording version {header.get('version')} in {path}")
+        return [tuple(json.loads(line)) for line in file if line.strip()]
+
+def synthetic_recording(turns: int = 3, chunks_per_turn: int = 50, chunk_ms: int = 100, sample_rate: int = 24000) -> list[tuple[float, str, str]]:
+    """Builds a session that resembles a voice conversation: the user speaks, then the model answers with audio."""
+    chunk = base64.b64encode(os.urandom(sample_rate * 2 * chunk_ms // 1000)).decode("ascii")
+    frames: list[tuple[float, str, str]] = []
+    t = 0.0
+
+    def add(direction: str, message: dict, step: float = 0.0):
+        nonlocal t
+        t += step
+        frames.append((round(t, 1), direction, json.dumps(message)))
+
+    add(FROM_SERVER, {"type": "session.created", "session": {"instructions": "", "tools": [], "tool_choice": "none", "max_response_output_tokens": None}})
+    add(FROM_CLIENT, {"type": "session.update", "session": {"turn_detection": {"type": "server_vad"}}}, 5)
+    add(FROM_SERVER, {"type": "session.updated", "session": {}}, 20)
+    for turn in range(turns):
+        for _ in range(chunks_per_turn):
+            add(FROM_CLIENT, {"type": "input_audio_buffer.append", "audio": chunk}, chunk_ms)
+        add(FROM_SERVER, {"type": "input_audio_buffer.speech_stopped"}, 10)
+        add(FROM_SERVER, {"type": "response.created", "response": {"id": f"resp_{turn}"}}, 150)
+        # The model streams audio faster than real time
+        for _ in range(chunks_per_turn):
+            add(FROM_SERVER, {"type": "response.audio.delta", "response_id": f"resp_{turn}", "delta": chunk}, chunk_ms / 4)
+        add(FROM_SERVER, {"type": "response.audio.done", "response_id": f"resp_{turn}"}, 5)
+        add(FROM_SERVER, {"type": "response.done", "response": {"id": f"resp_{turn}", "output": []}}, 5)
+    return frames
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import re
+from collections import deque
+from enum import Enum
+from typing import Any, Optional
+
+# Event types that carry audio and can be dropped without breaking the session state
+_AUDIO_DELTA_PATTERN = re.compile(r'"type"\s*:\s*"(?:response\.audio\.delta|input_audio_buffer\.append)"')
+
+def is_audio_delta(frame: str) -> bool:
+    # The type is serialized first, so only look at the head of the frame instead of the whole base64 payload
+    return _AUDIO_DELTA_PATTERN.search(frame, 0, 256) is not None
+
+class BackpressurePolicy(Enum):
+    BLOCK = "block"
+    DROP_AUDIO = "drop_audio"
+    CLOSE = "close"
+
+class RelayOverflow(Exception):
+    pass
+
+class RelayQueue:
+    """Bounded queue of outgoing frames for one direction of the relay.
+
+    Exposes send_str and send_json so it can stand in for the target websocket. When the queue is full the
+    policy decides whether the producer waits, the oldest queued audio delta is dropped, or the session is closed.
+    """
+
+    policy: BackpressurePolicy
+    max_frames: int
+    max_bytes: int
+    dropped: int = 0
+
+    def __init__(self, policy: BackpressurePolicy, max_frames: int, max_bytes: int):
+        self.policy = policy
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self._frames: deque[tuple[Optional[str | bytes], bool]] = deque()
+        self._size = 0
+        self._closed = False
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+    def _full(self) -> bool:
+        return len(self._frames) >= self.max_frames or self._size >= self.max_bytes
+
+    def _drop_oldest_audio(self) -> bool:
+        for i, (frame, droppable) in enumerate(self._frames):
+            if droppable:
+                del self._frames[i]
+                self._size -= len(frame)
+                self.dropped += 1
+                return True
+        return False
+
+    async def send_str(self, data: str):
+        await self._put(data, is_audio_delta(data))
+
+    async def send_bytes(self, data: bytes):
+        # Binary frames only ever carry raw audio
+        await self._put(data, True)
+
+    async def _put(self, data: str | bytes, droppable: bool):
+        while self._full() and not self._closed:
+            if self.policy == BackpressurePolicy.CLOSE:
+                self.abort()
+                raise RelayOverflow(f"Relay queue exceeded {self.max_frames} frames or {self.max_bytes} bytes")
+            if self.policy == BackpressurePolicy.DROP_AUDIO:
+                if droppable and not any(queued for _, queued in self._frames):
+                    # Nothing older to drop, the new delta is the stalest one we can afford to lose
+                    self.dropped += 1
+                    return
+                if self._drop_oldest_audio():
+                    continue
+            self._not_full.clear()
+            await self._not_full.wait()
+        if self._closed:
+            return
+        self._frames.append((data, droppable))
+        self._size += len(data)
+        self._not_empty.set()
+
+    async def send_json(self, data: Any):
+        await self.send_str(json.dumps(data))
+
+    async def get(self) -> Optional[str | bytes]:
+        """Returns the next frame, or None once the queue is closed and drained."""
+        while not self._frames:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        frame, _ = self._frames.popleft()
+        if frame is not None:
+            self._size -= len(frame)
+        if not self._full():
+            self._not_full.set()
+        return frame
+
+    def close(self):
+        """Lets the consumer drain the remaining frames and then stop."""
+        if not self._closed:
+            self._closed = True
+            self._frames.append((None, False))
+            self._not_empty.set()
+            self._not_full.set()
+
+    def abort(self):
+        """Discards the queued frames and stops the consumer right away."""
+        self._frames.clear()
+        self._size = 0
+        self._closed = False
+        self.close()
@@ -1,11 +1,17 @@
 import aiohttp
 import asyncio
+import base64
 import json
+import logging
 from typing import Any, Callable, Optional
 from aiohttp import web
 from azure.identity import DefaultAzureCredential, get_bearer_token_provider
 from azure.core.credentials import AzureKeyCredential
 from backend.tools import Tool, ToolResult, ToolResultDirection, RTToolCall
+from backend.recording import SessionRecorder, FROM_CLIENT, FROM_SERVER
+from backend.relay import BackpressurePolicy, RelayOverflow, RelayQueue
+
+logger = logging.getLogger("rtmt")
 
 class RTMiddleTier:
     endpoint: str
@@ -24,6 +30,18 @@ class RTMiddleTier:
     max_tokens: Optional[int] = None
     disable_audio: Optional[bool] = None
 
+    # If set, both sides of every session are recorded to this directory for later replay
+    recording_dir: Optional[str] = None
+
+    # Flow control for each relay direction, bounds the memory a slow client or upstream can pin
+    backpressure_policy: BackpressurePolicy = BackpressurePolicy.DROP_AUDIO
+    relay_queue_frames: int = 64
+    relay_queue_bytes: int = 1024 * 1024
+
+    # Browsers that negotiate this websocket sub-protocol exchange audio as raw PCM16 binary frames instead of
+    # base64 in JSON, the middle tier translates to and from the upstream JSON events. Control events stay JSON.
+    binary_audio_protocol: str = "realtime.pcm16"
+
     _tools_pending = {}
     _token_provider = None
 
@@ -36,11 +54,14 @@ class RTMiddleTier:
             self._token_provider = get_bearer_token_provider(credentials, "https://cognitiveservices.azure.com/.default")
             self._token_provider() # Warm up during startup so we have a token cached when the first request arrives
 
-    async def _process_message_to_client(self, msg: str, client_ws: web.WebSocketResponse, server_ws: web.WebSocketResponse) -> Optional[str]:
+    async def _process_message_to_client(self, msg: str, client_ws: RelayQueue, server_ws: RelayQueue, binary_audio: bool = False) -> Optional[str | bytes]:
         message = json.loads(msg.data)
         updated_message = msg.data
         if message is not None:
             match message["type"]:
+                case "response.audio.delta" if binary_audio:
+                    updated_message = base64.b64decode(message["delta"])
+
                 case "session.created":
                     session = message["session"]
                     # Hide the instructions, tools and max tokens from clients, if we ever allow client-side
@@ -76,7 +97,7 @@ class RTMiddleTier:
                         tool_call = self._tools_pending[message["item"]["call_id"]]
                         tool = self.tools[item["name"]]
                         args = item["arguments"]
-                        result = await tool.target(json.loads(args))
+                        result = await tool.invoke(json.loads(args))
                         await server_ws.send_json({
                             "type": "conversation.item.create",
                             "item": {
@@ -116,7 +137,7 @@ class RTMiddleTier:
 
         return updated_message
 
-    async def _process_message_to_server(self, msg: str, ws: web.WebSocketResponse) -> Optional[str]:
+    async def _process_message_to_server(self, msg: str, ws: RelayQueue) -> Optional[str]:
         message = json.loads(msg.data)
         updated_message = msg.data
         if message is not None:
@@ -148,36 +169,93 @@ class RTMiddleTier:
                 headers = { "api-key": self.key }
             else:
                 headers = { "Authorization": f"Bearer {self._token_provider()}" } # NOTE: no async version of token provider, maybe refresh token on a timer?
+            recorder = SessionRecorder.in_directory(self.recording_dir) if self.recording_dir else None
             async with session.ws_connect("/openai/realtime", headers=headers, params=params) as target_ws:
+                binary_audio = ws.ws_protocol == self.binary_audio_protocol
+                to_server = RelayQueue(self.backpressure_policy, self.relay_queue_frames, self.relay_queue_bytes)
+                to_client = RelayQueue(self.backpressure_policy, self.relay_queue_frames, self.relay_queue_bytes)
+
                 async def from_client_to_server():
-                    async for msg in ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            new_msg = await self._process_message_to_server(msg, ws)
-                            if new_msg is not None:
-                                await target_ws.send_str(new_msg)
-                        else:
-                            print("Error: unexpected message type:", msg.type)
+                    try:
+                        async for msg in ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                if recorder is not None:
+                                    recorder.record(FROM_CLIENT, msg.data)
+                                new_msg = await self._process_message_to_server(msg, to_client)
+                                if new_msg is not None:
+                                    await to_server.send_str(new_msg)
+                            elif msg.type == aiohttp.WSMsgType.BINARY and binary_audio:
+                                new_msg = json.dumps({
+                                    "type": "input_audio_buffer.append",
+                                    "audio": base64.b64encode(msg.data).decode("ascii")
+                                })
+                                if recorder is not None:
+                                    recorder.record(FROM_CLIENT, new_msg)
+                                await to_server.send_str(new_msg)
+                            else:
+                                print("Error: unexpected message type:", msg.type)
+                    finally:
+                        to_server.close()
 
                 async def from_server_to_client():
-                    async for msg in target_ws:
-                        if msg.type == aiohttp.WSMsgType.TEXT:
-                            new_msg = await self._process_message_to_client(msg, ws, target_ws)
-                            if new_msg is not None:
-                                await ws.send_str(new_msg)
+                    try:
+                        async for msg in target_ws:
+                            if msg.type == aiohttp.WSMsgType.TEXT:
+                                if recorder is not None:
+                                    recorder.record(FROM_SERVER, msg.data)
+                                new_msg = await self._process_message_to_client(msg, to_client, to_server, binary_audio)
+                                if isinstance(new_msg, bytes):
+                                    await to_client.send_bytes(new_msg)
+                                elif new_msg is not None:
+                                    await to_client.send_str(new_msg)
+                            else:
+                                print("Error: unexpected message type:", msg.type)
+                    finally:
+                        to_client.close()
+
+                async def drain(queue: RelayQueue, target):
+                    while (frame := await queue.get()) is not None:
+                        if isinstance(frame, bytes):
+                            await target.send_bytes(frame)
                         else:
-                            print("Error: unexpected message type:", msg.type)
+                            await target.send_str(frame)
 
+                readers = [asyncio.create_task(from_client_to_server()), asyncio.create_task(from_server_to_client())]
+                writers = [asyncio.create_task(drain(to_server, target_ws)), asyncio.create_task(drain(to_client, ws))]
                 try:
-                    await asyncio.gather(from_client_to_server(), from_server_to_client())
-                except ConnectionResetError:
-                    # Ignore the errors resulting from the client disconnecting the socket
-                    pass
+                    # A side closing ends its reader, which closes the queue towards the other side. Once that queue
+                    # is flushed the session is over and everything else is cancelled.
+                    await asyncio.wait(writers, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    for task in readers + writers:
+                        task.cancel()
+                    results = await asyncio.gather(*readers, *writers, return_exceptions=True)
+                    await ws.close()
+                    if recorder is not None:
+                        recorder.close()
+
+                if to_client.dropped or to_server.dropped:
+                    logger.info("Dropped %d audio frames to the client and %d to the server", to_client.dropped, to_server.dropped)
+                for result in results:
+                    if isinstance(result, RelayOverflow):
+                        logger.warning("Closing slow session: %s", result)
+                    elif isinstance(result, ConnectionResetError):
+                        # Ignore the errors resulting from the client disconnecting the socket
+                        pass
+                    elif isinstance(result, Exception):
+                        raise result
 
     async def _websocket_handler(self, request: web.Request):
-        ws = web.WebSocketResponse()
+        ws = web.WebSocketResponse(protocols=(self.binary_audio_protocol,))
         await ws.prepare(request)
         await self._forward_messages(ws)
         return ws
 
+    def tool_cache_stats(self) -> dict[str, dict[str, int]]:
+        return {
+            name: {"hits": tool.cache.hits, "misses": tool.cache.misses}
+            for name, tool in self.tools.items() if tool.cache is not None
+        }
+
     def attach_to_app(self, app, path):
         app.router.add_get(path, self._websocket_handler)
@@ -1,6 +1,8 @@
 import json
+import time
+from collections import OrderedDict
 from enum import Enum
-from typing import Any, Callable
+from typing import Any, Callable, Optional
 from azure.core.credentials import AzureKeyCredential
 from azure.identity import DefaultAzureCredential
 
@@ -21,13 +23,77 @@ class ToolResult:
             return ""
         return self.text if type(self.text) == str else json.dumps(self.text)
 
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+def default_cache_key(args: Any) -> str:
+    """Case and whitespace insensitive key over the tool arguments."""
+    return json.dumps(_normalize(args), sort_keys=True)
+
+class ToolResultCache:
+    ttl: float
+    max_entries: int
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, ToolResult]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[ToolResult]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, result: ToolResult):
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
 class Tool:
     target: Callable[..., ToolResult]
     schema: Any
+    cache: Optional[ToolResultCache] = None
 
-    def __init__(self, target: Any, schema: Any):
+    # Set cache_ttl to None to opt out of caching, e.g. for tools with side effects
+    def __init__(self, target: Any, schema: Any, cache_ttl: Optional[float] = 60.0, cache_size: int = 128, cache_key: Callable[[Any], str] = default_cache_key):
         self.target = target
         self.schema = schema
+        self.cache_key = cache_key
+        if cache_ttl:
+            self.cache = ToolResultCache(cache_ttl, cache_size)
+
+    async def invoke(self, args: Any) -> ToolResult:
+        if self.cache is None:
+            return await self.target(args)
+
+        key = self.cache_key(args)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        result = await self.target(args)
+        # Store the serialized payload so cache hits skip json.dumps as well
+        result = ToolResult(result.to_text(), result.destination)
+        self.cache.put(key, result)
+        return result
 
 class RTToolCall:
     tool_call_id: str
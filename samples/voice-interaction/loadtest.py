@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import resource
+import time
+import aiohttp
+from aiohttp import web
+from azure.core.credentials import AzureKeyCredential
+
+from app import configure_middle_tier
+from backend.fakeupstream import FakeRealtimeServer, REPLAY_DONE
+from backend.recording import FROM_CLIENT, load_recording, synthetic_recording
+from backend.relay import BackpressurePolicy
+from backend.rtmt import RTMiddleTier
+from reportstore.filedb import FileDBStore
+
+logger = logging.getLogger("loadtest")
+
+class RelayTimings:
+    """Correlates send and receive times of frames by event_id to measure the overhead added by the middle tier."""
+
+    def __init__(self):
+        self._pending: dict[str, float] = {}
+        self.latencies: dict[str, list[float]] = {"server_to_client": [], "client_to_server": []}
+        self.frames = 0
+        self.bytes = 0
+
+    def sent(self, event_id: str):
+        self._pending[event_id] = time.perf_counter()
+
+    def received(self, event_id: str, direction: str):
+        sent_at = self._pending.pop(event_id, None)
+        if sent_at is not None:
+            self.latencies[direction].append((time.perf_counter() - sent_at) * 1000)
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS, peak only
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+async def run_client(session_id: int, url: str, frames: list[tuple[float, str, str]], speed: float, timings: RelayTimings, binary_protocol: str = None):
+    client_frames = [(offset, json.loads(frame)) for offset, direction, frame in frames if direction == FROM_CLIENT]
+    if binary_protocol:
+        # Audio goes out as raw PCM, those frames carry no event id and are not part of the latency figures
+        client_frames = [(offset, base64.b64decode(message["audio"]) if message.get("type") == "input_audio_buffer.append" else message)
+                         for offset, message in client_frames]
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(url, protocols=(binary_protocol,) if binary_protocol else ()) as ws:
+            async def send():
+                start = time.perf_counter()
+                for seq, (offset, message) in enumerate(client_frames):
+                    delay = offset / 1000 / speed - (time.perf_counter() - start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    if isinstance(message, bytes):
+                        await ws.send_bytes(message)
+                        continue
+                    event_id = f"client_{session_id}_{seq}"
+                    data = json.dumps({**message, "event_id": event_id})
+                    timings.sent(event_id)
+                    await ws.send_str(data)
+
+            async def receive():
+                async for msg in ws:
+                    if msg.type == aiohttp.WSMsgType.BINARY:
+                        timings.frames += 1
+                        timings.bytes += len(msg.data)
+                        continue
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    message = json.loads(msg.data)
+                    timings.frames += 1
+                    timings.bytes += len(msg.data)
+                    if message.get("type") == REPLAY_DONE:
+                        return
+                    if "event_id" in message:
+                        timings.received(message["event_id"], "server_to_client")
+
+            sender = asyncio.create_task(send())
+            await receive()
+            await sender
+
+async def run(args):
+    frames = load_recording(args.recording) if args.recording else synthetic_recording()
+    timings = RelayTimings()
+
+    fake = FakeRealtimeServer(frames, speed=args.speed, on_sent=timings.sent,
+                              on_received=lambda event_id: timings.received(event_id, "client_to_server"))
+    upstream_app = web.Application()
+    fake.attach_to_app(upstream_app)
+    upstream = web.AppRunner(upstream_app)
+    await upstream.setup()
+    await web.TCPSite(upstream, "localhost", args.upstream_port).start()
+
+    rtmt = RTMiddleTier(f"http://localhost:{args.upstream_port}", "replay", AzureKeyCredential("replay"))
+    configure_middle_tier(rtmt, FileDBStore())
+    rtmt.recording_dir = args.record_dir
+    rtmt.backpressure_policy = BackpressurePolicy(args.policy)
+    middle_app = web.Application()
+    rtmt.attach_to_app(middle_app, "/realtime")
+    middle = web.AppRunner(middle_app)
+    await middle.setup()
+    await web.TCPSite(middle, "localhost", args.port).start()
+
+    url = f"http://localhost:{args.port}/realtime"
+    rss_before = current_rss_bytes()
+    rss_peak = rss_before
+
+    async def sample_memory():
+        nonlocal rss_peak
+        while True:
+            rss_peak = max(rss_peak, current_rss_bytes())
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.create_task(sample_memory())
+    start = time.perf_counter()
+    binary_protocol = rtmt.binary_audio_protocol if args.binary else None
+    results = await asyncio.gather(*[run_client(i, url, frames, args.speed, timings, binary_protocol) for i in range(args.sessions)], return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+
+    await middle.cleanup()
+    await upstream.cleanup()
+
+    failures = [r for r in results if isinstance(r, Exception)]
+    for failure in failures[:5]:
+        logger.error("Session failed: %r", failure)
+
+    print(f"sessions:        {args.sessions} ({len(failures)} failed)")
+    print(f"duration:        {elapsed:.2f}s")
+    print(f"throughput:      {timings.frames / elapsed:.0f} frames/s, {timings.bytes / elapsed / 1024 / 1024:.2f} MiB/s to clients")
+    for direction, latencies in timings.latencies.items():
+        print(f"{direction + ':':<17}p50 {percentile(latencies, 50):.2f}ms  p90 {percentile(latencies, 90):.2f}ms  "
+              f"p99 {percentile(latencies, 99):.2f}ms  max {percentile(latencies, 100):.2f}ms  ({len(latencies)} frames)")
+    print(f"memory:          {(rss_peak - rss_before) / max(1, args.sessions) / 1024:.0f} KiB/session peak RSS growth")
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description="Replays recorded realtime sessions through RTMiddleTier against a local fake upstream.")
+    parser.add_argument("--recording", help="Session recording (.jsonl.gz) captured with REALTIME_RECORDING_DIR, a synthetic session is used if omitted")
+    parser.add_argument("--sessions", type=int, default=10, help="Number of concurrent synthetic clients")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor, 2.0 replays twice as fast as recorded")
+    parser.add_argument("--policy", choices=[p.value for p in BackpressurePolicy], default=BackpressurePolicy.DROP_AUDIO.value, help="Backpressure policy of the relay")
+    parser.add_argument("--binary", action="store_true", help="Exchange audio as raw PCM binary frames with the middle tier")
+    parser.add_argument("--record-dir", help="Record the relayed sessions to this directory")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--upstream-port", type=int, default=8767)
+    asyncio.run(run(parser.parse_args()))
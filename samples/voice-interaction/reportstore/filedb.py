@@ -5,25 +5,57 @@ from logging import INFO
 from typing import Any
 from typing import List, Optional, Union, TYPE_CHECKING
 from backend.rtmt import RTMiddleTier, Tool, ToolResult, ToolResultDirection
+from reportstore.index import ProductIndex
 
 class FileDBStore:
     logging.basicConfig(level=logging.INFO)
 
     categories = []
 
+    # Fields of a catalog item that are returned to the model
+    result_fields = ("name", "description", "image", "text", "category")
+
     def load_from_file(self, file_path: str):
         with open(file_path, "r") as file:
             return json.load(file)
 
     def init_data(self):
         self.logger.info("Creating container in database")
-        templates_path = os.path.join(os.path.dirname(__file__), 'categories.json')
-        self.categories = self.load_from_file(templates_path)
-        # print(self.categories)
+        mtime = os.stat(self.templates_path).st_mtime_ns
+        categories = self.load_from_file(self.templates_path)
+        index = ProductIndex(categories)
+        # Serialize every item once, results are assembled from these fragments per call
+        serialized = [json.dumps({field: item.get(field) for field in self.result_fields}) for item in categories]
+
+        self.categories = categories
+        self._index = index
+        self._serialized = serialized
+        self._mtime = mtime
+        self.logger.info("Indexed %d products", len(categories))
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.templates_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.logger.info("Catalog changed on disk, reloading")
+            try:
+                self.init_data()
+            except (OSError, ValueError) as e:
+                # Keep serving the previous catalog if the file is mid-write or invalid
+                self.logger.warning("Failed to reload catalog: %s", e)
 
-    def __init__(self):
+    def catalog_version(self) -> int:
+        """Reloads the catalog if it changed on disk and returns the modification time of the loaded one."""
+        self._reload_if_changed()
+        return self._mtime
+
+    def __init__(self, top_k: int = 5):
         self.logger = logging.getLogger("filedb")
         self.logger.info("Initializing FileDBStore")
+        self.templates_path = os.path.join(os.path.dirname(__file__), 'categories.json')
+        self.top_k = top_k
         self.init_data()  
     
     async def show_product_information(self, args: Any) -> ToolResult:
@@ -38,19 +70,14 @@ class FileDBStore:
         return ToolResult(information, ToolResultDirection.TO_CLIENT)
             
     async def get_products(self, args: Any) -> ToolResult:
-        print("getting products")
-        print(args)
-        responses = []
-
-        for item in self.categories:
-            option = {}
-            option["name"] = item["name"]
-            option["description"] = item["description"]
-            option["image"] = item["image"]
-            option["text"] = item["text"]
-            option["category"] = item["category"]
-            responses.append(option)
+        self.logger.info("getting products for %s", args)
+        self._reload_if_changed()
 
-        print(responses)
+        keywords = args.get("keywords", "") if args else ""
+        ids = self._index.search(keywords, self.top_k)
+        if not ids:
+            # Nothing matched, hand the model a small sample instead of the full catalog
+            ids = range(min(self.top_k, len(self._serialized)))
 
+        responses = "[" + ", ".join(self._serialized[i] for i in ids) + "]"
         return ToolResult(responses, ToolResultDirection.TO_SERVER)
@@ -0,0 +1,61 @@
+import math
+import re
+from collections import defaultdict
+from typing import Any
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(text.lower()) if text else []
+
+class ProductIndex:
+    """In-memory inverted index with BM25 ranking over the product catalog."""
+
+    fields: tuple[str, ...] = ("name", "description", "text", "category")
+
+    # Matches in the name or category are stronger signals than matches in the long descriptions
+    field_weights: dict[str, float] = {"name": 3.0, "category": 2.0, "description": 1.0, "text": 1.0}
+
+    k1: float = 1.2
+    b: float = 0.75
+
+    def __init__(self, items: list[dict[str, Any]]):
+        self.items = items
+        self._postings: dict[str, dict[int, float]] = defaultdict(dict)
+        self._doc_lengths: list[float] = []
+        self._idf: dict[str, float] = {}
+        self._build()
+
+    def _build(self):
+        for doc_id, item in enumerate(self.items):
+            term_frequencies: dict[str, float] = defaultdict(float)
+            length = 0.0
+            for field in self.fields:
+                weight = self.field_weights.get(field, 1.0)
+                for token in tokenize(str(item.get(field, ""))):
+                    term_frequencies[token] += weight
+                    length += weight
+            self._doc_lengths.append(length)
+            for token, frequency in term_frequencies.items():
+                self._postings[token][doc_id] = frequency
+
+        count = len(self.items)
+        self._avg_length = (sum(self._doc_lengths) / count) if count else 0.0
+        for token, postings in self._postings.items():
+            df = len(postings)
+            self._idf[token] = math.log(1 + (count - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int) -> list[int]:
+        """Returns the ids of the top_k items ranked by BM25 score for the query."""
+        scores: dict[int, float] = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = self._idf[token]
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / self._avg_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))
+        return [doc_id for doc_id, _ in ranked[:top_k]]
@@ -10,6 +10,9 @@ let mediaStream = null;
 let mediaProcessor = null;
 let audioQueueTime = 0;
 
+// Sub-protocol for raw PCM16 audio frames, control events stay JSON
+const BINARY_AUDIO_PROTOCOL = 'realtime.pcm16';
+
 // Variables for client-side VAD (optional)
 let speaking = false;
 const VAD_THRESHOLD = 0.01; // Adjust this threshold as needed
@@ -27,11 +30,12 @@ async function startRecording() {
 
     // Open WebSocket connection
     if (window.location.protocol != "https:") {
-        websocket = new WebSocket(`ws://${window.location.host}/realtime`);
+        websocket = new WebSocket(`ws://${window.location.host}/realtime`, [BINARY_AUDIO_PROTOCOL]);
     }else
     {
-        websocket = new WebSocket(`wss://${window.location.host}/realtime`);
+        websocket = new WebSocket(`wss://${window.location.host}/realtime`, [BINARY_AUDIO_PROTOCOL]);
     }    
+    websocket.binaryType = 'arraybuffer';
 
     websocket.onopen = () => {
         console.log('WebSocket connection opened');
@@ -57,6 +61,11 @@ async function startRecording() {
     };
 
     websocket.onmessage = (event) => {
+        if (event.data instanceof ArrayBuffer) {
+            // Raw PCM16 audio delta
+            playPcm(new Int16Array(event.data));
+            return;
+        }
         const message = JSON.parse(event.data);
         // console.log('Received message:', message);
         handleWebSocketMessage(message);
@@ -85,14 +94,19 @@ async function startRecording() {
         const inputData = e.inputBuffer.getChannelData(0);
         // Convert Float32Array to Int16Array
         const int16Data = float32ToInt16(inputData);
-        // Convert to Base64
-        const base64Audio = int16ToBase64(int16Data);
-        // Send audio data to server
-        const audioCommand = {
-            type: 'input_audio_buffer.append',
-            audio: base64Audio
-        };
-        websocket.send(JSON.stringify(audioCommand));
+        if (websocket.protocol === BINARY_AUDIO_PROTOCOL) {
+            // Send the raw samples, the server wraps them into input_audio_buffer.append
+            websocket.send(int16Data.buffer);
+        } else {
+            // Convert to Base64
+            const base64Audio = int16ToBase64(int16Data);
+            // Send audio data to server
+            const audioCommand = {
+                type: 'input_audio_buffer.append',
+                audio: base64Audio
+            };
+            websocket.send(JSON.stringify(audioCommand));
+        }
 
         // Optional: Client-side VAD for immediate interruption handling
         const isUserSpeaking = detectSpeech(inputData);
@@ -180,8 +194,10 @@ function playAudio(base64Audio) {
     for (let i = 0; i < len; i++) {
         bytes[i] = binary.charCodeAt(i);
     }
-    const int16Array = new Int16Array(bytes.buffer);
+    playPcm(new Int16Array(bytes.buffer));
+}
 
+function playPcm(int16Array) {
     // Convert Int16Array to Float32Array
     const float32Array = int16ToFloat32(int16Array);
 